@@ -3,6 +3,11 @@ import dash
 from dash import Dash, html, page_container, page_registry
 import dash_bootstrap_components as dbc
 
+from ctba import compression, metrics, staticfigs
+from ctba.figcache import figure_cache
+from ctba.upstream import start_refreshers
+from ctba.memory import register_debug_routes, track
+
 
 app = Dash(
     __name__,
@@ -13,6 +18,13 @@ app = Dash(
 )
 server = app.server
 
+# /debug/memory (CTBA_DEBUG=1): per-worker dataset sizes for capacity planning
+track("figure_cache", lambda: figure_cache)
+track("compressed_static", lambda: compression.variants)
+register_debug_routes(server)
+# /figures/<hash>.json: figures exported by `python -m ctba.staticfigs`
+staticfigs.register_routes(server)
+
 def toc():
     pages_sorted = sorted(
         page_registry.values(),
@@ -34,6 +46,16 @@ app.layout = html.Div(
     className="shell"
 )
 
+# /metrics (CTBA_METRICS=1): callback latency by phase, page views per path
+metrics.install(app)
+
+# background refreshes run in the serving processes only, never in a
+# gunicorn master that preloaded the app
+server.before_request(start_refreshers)
+
+# gzip/brotli for callback responses; assets and bundles are compressed once, here
+compression.install(app)
+
 
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,80 @@
+// assets/clientside.js
+// Browser-side year switching for the choropleth pages (CTBA_CLIENTSIDE=1).
+// Each page ships its per-year values once in a dcc.Store; these functions
+// restyle the figure that is already on the page instead of asking the server.
+// loadFigures fetches figures exported by `python -m ctba.staticfigs`.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    ctba: {
+        loadFigures: function (urls) {
+            // one URL -> one figure, a list of URLs -> a list of figures
+            const noUpdate = window.dash_clientside.no_update;
+            const load = function (url) {
+                return url ? fetch(url).then(function (r) { return r.json(); }) : noUpdate;
+            };
+            if (!urls) {
+                return noUpdate;
+            }
+            return Array.isArray(urls) ? Promise.all(urls.map(load)) : load(urls);
+        },
+
+        electricityMap: function (year, sector, month, table, fig) {
+            if (!table) {
+                return window.dash_clientside.no_update;
+            }
+            fig = (fig && fig.data && fig.data.length) ? fig : table.template;
+            const m = (month === null || month === "all") ? "all" : String(month);
+            const bySector = table.values[sector] || {};
+            const rows = bySector[m] || [];
+            const values = rows[table.years.indexOf(Number(year))] || [];
+
+            const locations = [];
+            const z = [];
+            values.forEach(function (v, i) {
+                if (v !== null) {
+                    locations.push(table.states[i]);
+                    z.push(v);
+                }
+            });
+            const period = m === "all" ? String(year) : table.months[Number(m) - 1] + " " + year;
+            const title = table.sectorLabels[sector] + " Electricity Prices — " + period;
+
+            const trace = Object.assign({}, fig.data[0], {locations: locations, z: z});
+            const layout = Object.assign({}, fig.layout, {
+                title: Object.assign({}, fig.layout.title, {text: title})
+            });
+            return Object.assign({}, fig, {data: [trace].concat(fig.data.slice(1)), layout: layout});
+        },
+
+        happinessFigures: function (year, table, mapFig, barFig) {
+            const noUpdate = window.dash_clientside.no_update;
+            const row = table && table.years[String(year)];
+            if (!row) {
+                return [noUpdate, noUpdate];
+            }
+            mapFig = (mapFig && mapFig.data && mapFig.data.length) ? mapFig : table.templates[0];
+            barFig = (barFig && barFig.data && barFig.data.length) ? barFig : table.templates[1];
+            const retitle = function (fig, text) {
+                return Object.assign({}, fig.layout, {
+                    title: Object.assign({}, fig.layout.title, {text: text})
+                });
+            };
+            const mapTrace = Object.assign({}, mapFig.data[0], {
+                locations: row.countries, z: row.scores, hovertext: row.countries
+            });
+            const barTrace = Object.assign({}, barFig.data[0], {
+                x: row.bar_scores, y: row.bar_countries,
+                marker: Object.assign({}, barFig.data[0].marker, {color: row.bar_scores})
+            });
+            return [
+                Object.assign({}, mapFig, {
+                    data: [mapTrace],
+                    layout: retitle(mapFig, "Happiness Score by Country - " + year)
+                }),
+                Object.assign({}, barFig, {
+                    data: [barTrace],
+                    layout: retitle(barFig, "Top and Bottom 10 Countries - " + year)
+                })
+            ];
+        }
+    }
+});
@@ -0,0 +1 @@
+"""Benchmarks for the CTBA pages; run each module with ``python -m bench.<name>``."""
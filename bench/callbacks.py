@@ -0,0 +1,219 @@
+# bench/callbacks.py
+"""Latency, payload size and peak memory of the page callbacks.
+
+Imports the app with the Open-Meteo and NASA APIs pointed at a local stub
+(bench.stubs), then calls each callback directly, cycling through its
+inputs. Cached callbacks are timed cold (cache cleared before every call)
+and warm. The Job Changes figure builders run against the bundled weekly
+drop resampled to 1x, 10x and 100x its size.
+
+Results are written as JSON so two commits can be compared:
+
+    python -m bench.callbacks --out before.json
+    python -m bench.callbacks --out after.json --compare before.json
+
+Run it with CTBA_BACKEND=sqlite to compare the query backend (ctba.sqldb)
+against the in-memory pandas frames.
+"""
+import argparse
+import datetime as dt
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from bench.stubs import ROOT, stubbed_app
+from ctba.sqldb import BACKEND
+
+SCALES = (1, 10, 100)
+
+
+def percentile_ms(samples: list, q: float) -> float:
+    return round(float(np.percentile(samples, q)) * 1000, 3)
+
+
+def payload_bytes(result) -> int:
+    """Size of the callback's response body, as Dash would serialise it."""
+    from plotly.io.json import to_json_plotly
+    return len(to_json_plotly(result).encode())
+
+
+def measure(name: str, fn, inputs: list, repeat: int, setup=None, warmup=False, **extra) -> dict:
+    """Call fn(*args) `repeat` times cycling through inputs; setup() runs untimed before each call.
+
+    With warmup, every input is called once before timing starts, so caches are primed.
+    """
+    calls = list(itertools.islice(itertools.cycle(inputs), repeat))
+    if warmup:
+        for args in inputs:
+            fn(*args)
+    samples = []
+    for args in calls:
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        result = fn(*args)
+        samples.append(time.perf_counter() - t0)
+
+    # a separate, shorter pass under tracemalloc so its overhead stays out of the timings
+    peak = 0
+    for args in calls[:min(len(calls), 5)]:
+        if setup:
+            setup()
+        tracemalloc.start()
+        fn(*args)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "name": name,
+        **extra,
+        "calls": len(samples),
+        "p50_ms": percentile_ms(samples, 50),
+        "p95_ms": percentile_ms(samples, 95),
+        "p99_ms": percentile_ms(samples, 99),
+        "mean_ms": round(float(np.mean(samples)) * 1000, 3),
+        "response_bytes": payload_bytes(result),
+        "peak_mem_bytes": peak,
+    }
+
+
+def page_module(path: str):
+    import dash
+    for page in dash.page_registry.values():
+        if page["path"] == path:
+            return sys.modules[page["module"]]
+    raise LookupError(f"no page registered at {path}")
+
+
+def scaled_frame(base: pd.DataFrame, scale: int, seed: int = 0) -> pd.DataFrame:
+    if scale == 1:
+        return base
+    rng = np.random.default_rng(seed)
+    return base.iloc[rng.integers(0, len(base), len(base) * scale)].reset_index(drop=True)
+
+
+def run(repeat: int) -> list:
+    from ctba.figcache import figure_cache
+
+    electricity = page_module("/electricity")
+    happy = page_module("/happy")
+    weather = page_module("/weather")
+    apod_page = page_module("/nasa-image")
+    jobs = page_module("/JobChanges")
+
+    results = []
+
+    years, sectors = electricity.price_axes()  # what the page's dropdowns offer
+    map_inputs = [(y, s, m) for y in years for s in sectors for m in ("all", 1, 7)]
+    results.append(measure("electricity.update_map", electricity.update_map, map_inputs, repeat,
+                           setup=figure_cache.clear, cache="cold"))
+    results.append(measure("electricity.update_map", electricity.update_map, map_inputs[:8], repeat,
+                           warmup=True, cache="warm"))
+
+    states = sorted({state for state, _ in electricity.series_keys.get()})
+    drill_inputs = [(states[i:i + n], "residential") for n in (1, 8) for i in range(0, len(states) - n, 7)]
+    results.append(measure("electricity.series_figure", electricity.series_figure, drill_inputs, repeat,
+                           setup=figure_cache.clear, cache="cold"))
+
+    # what the page sends after the first render (CTBA_PATCH=1)
+    results.append(measure("electricity.patch_map", electricity.patch_map, map_inputs, repeat))
+
+    happy_years = [int(y) for y in happy.years()]  # from the active backend's data
+    results.append(measure("happy.update_dashboard", happy.update_dashboard, [(y,) for y in happy_years],
+                           repeat, setup=figure_cache.clear, cache="cold"))
+    results.append(measure("happy.update_dashboard", happy.update_dashboard, [(y,) for y in happy_years],
+                           repeat, warmup=True, cache="warm"))
+    results.append(measure("happy.patch_dashboard", happy.patch_dashboard, [(y,) for y in happy_years], repeat))
+
+    cities = [(c, None) for c in weather.CITY_COORDS]
+    results.append(measure("weather.update", weather.update, cities, repeat,
+                           setup=weather.forecast_cache.clear, cache="cold"))
+    results.append(measure("weather.update", weather.update, cities, repeat, warmup=True, cache="warm"))
+    results.append(measure("weather.update_compare", weather.update_compare, [(None,)], repeat,
+                           setup=weather.forecast_cache.clear, cache="cold"))
+    results.append(measure("weather.update_compare", weather.update_compare, [(None,)], repeat,
+                           warmup=True, cache="warm"))
+
+    # every cold call asks for a date the local store has not seen yet
+    fresh_dates = ((dt.date(2020, 1, 1) - dt.timedelta(days=i)).isoformat() for i in itertools.count())
+    results.append(measure("apod.show_apod", lambda: apod_page.show_apod(next(fresh_dates)), [()], repeat,
+                           cache="cold"))
+    results.append(measure("apod.show_apod", apod_page.show_apod, [("2020-01-01",)], repeat,
+                           warmup=True, cache="warm"))
+
+    sample = sorted(jobs.DATA_DIR.glob(jobs.DATA_PATTERN))[-1]
+    base = jobs.load_data(sample)
+    for scale in SCALES:
+        frame = scaled_frame(base, scale)
+        for builder in (jobs.fig_top_departure_companies, jobs.fig_top_departure_functions,
+                        jobs.fig_weekly_arrivals_vs_departures):
+            results.append(measure(f"jobs.{builder.__name__}", builder, [(frame,)], max(repeat // scale, 5),
+                                   scale=scale, rows=len(frame)))
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def case_key(row: dict) -> tuple:
+    return row["name"], row.get("cache"), row.get("scale")
+
+
+def label(row: dict) -> str:
+    extra = row.get("cache") or (f"{row['scale']}x" if row.get("scale") else "")
+    return f"{row['name']} [{extra}]" if extra else row["name"]
+
+
+def print_table(results: list, baseline: list = None) -> None:
+    before = {case_key(r): r for r in baseline or []}
+    print(f"{'case':<52} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'bytes':>10} {'peak KiB':>9}")
+    for r in results:
+        line = (f"{label(r):<52} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+                f"{r['response_bytes']:>10,} {r['peak_mem_bytes'] / 1024:>9,.0f}")
+        old = before.get(case_key(r))
+        if old:
+            line += (f"   p50 x{old['p50_ms'] / max(r['p50_ms'], 1e-6):.2f}"
+                     f"  bytes x{old['response_bytes'] / max(r['response_bytes'], 1):.2f}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50, help="calls per case (scaled down for large datasets)")
+    parser.add_argument("--out", type=Path, help="write results as JSON")
+    parser.add_argument("--compare", type=Path, help="JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    with stubbed_app():
+        results = run(args.repeat)
+
+    baseline = json.loads(args.compare.read_text())["results"] if args.compare else None
+    print_table(results, baseline)
+    if args.out:
+        report = {
+            "commit": git_commit(),
+            "created": dt.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "backend": BACKEND,
+            "results": results,
+        }
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# bench/compression.py
+"""Bytes on the wire per page, uncompressed vs gzip vs brotli.
+
+Replays what a first visit downloads through the Flask test client:
+the index page and every script it references (shared by all pages),
+the Plotly bundle the graphs load, then for each page in page_registry
+the routing callback that returns its layout and the initial callback
+for every control in that layout.
+
+    python -m bench.compression
+"""
+import re
+
+from dash import page_registry
+
+from bench.stubs import stubbed_app
+
+ENCODINGS = ("identity", "gzip", "br")
+
+
+def find_props(node, found=None) -> dict:
+    """{component id: props} for every component in a serialized layout."""
+    found = {} if found is None else found
+    if isinstance(node, dict):
+        props = node.get("props")
+        if isinstance(props, dict) and isinstance(props.get("id"), str):
+            found[props["id"]] = props
+        for value in node.values():
+            find_props(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            find_props(value, found)
+    return found
+
+
+def shared_requests(client, dash_app) -> list:
+    index = client.get("/").get_data(as_text=True)
+    urls = ["/"] + re.findall(r'(?:src|href)="(/[^"]+\.(?:js|css)[^"]*)"', index)
+    plotly = next(iter(dash_app.registered_paths.get("plotly", [])), None)
+    if plotly:
+        urls.append(f"/_dash-component-suites/plotly/{plotly}")
+    return [("GET", url, None) for url in urls]
+
+
+def page_requests(client, dash_app, path: str) -> list:
+    """The routing callback for path, then the initial callback of each control it renders."""
+    routing = next(k for k in dash_app.callback_map if "_pages_content.children" in k)
+    body = {
+        "output": routing,
+        "outputs": [{"id": "_pages_content", "property": "children"}, {"id": "_pages_store", "property": "data"}],
+        "inputs": [{"id": "_pages_location", "property": "pathname", "value": path},
+                   {"id": "_pages_location", "property": "search", "value": ""}],
+        "changedPropIds": ["_pages_location.pathname"],
+    }
+    calls = [("POST", "/_dash-update-component", body)]
+    layout = client.post("/_dash-update-component", json=body).get_json()
+    props = find_props(layout["response"]["_pages_content"]["children"])
+
+    deferred = {c["output"] for c in dash_app._callback_list if c.get("prevent_initial_call")}
+    for output, spec in dash_app.callback_map.items():
+        inputs = spec["inputs"]
+        if output in deferred or not inputs or not all(i["id"] in props for i in inputs):
+            continue
+        outputs = [{"id": o.split(".")[0], "property": o.split(".")[1]}
+                   for o in output.strip(".").split("...")]
+        calls.append(("POST", "/_dash-update-component", {
+            "output": output,
+            "outputs": outputs if len(outputs) > 1 else outputs[0],
+            "inputs": [{**i, "value": props[i["id"]].get(i["property"])} for i in inputs],
+            "state": [{**s, "value": props.get(s["id"], {}).get(s["property"])} for s in spec.get("state", [])],
+            "changedPropIds": [],
+        }))
+    return calls
+
+
+def transfer(client, calls: list, encoding: str) -> int:
+    total = 0
+    for method, url, body in calls:
+        headers = {"Accept-Encoding": encoding}
+        response = client.post(url, json=body, headers=headers) if method == "POST" else client.get(url, headers=headers)
+        total += len(response.data)
+    return total
+
+
+def main():
+    with stubbed_app() as (app, _):
+        dash_app = app.app
+        client = dash_app.server.test_client()
+        rows = [("shared (index + bundles)", shared_requests(client, dash_app))]
+        pages = sorted(page_registry.values(), key=lambda p: (p.get("order", 10_000), p["path"]))
+        rows += [(p["path"], page_requests(client, dash_app, p["path"])) for p in pages]
+
+        print(f"{'page':<28} {'requests':>8} {'identity':>12} {'gzip':>12} {'br':>12} {'saved':>7}")
+        for name, calls in rows:
+            sizes = {e: transfer(client, calls, e) for e in ENCODINGS}
+            best = min(sizes.values())
+            print(f"{name:<28} {len(calls):>8} {sizes['identity']:>12,} {sizes['gzip']:>12,} {sizes['br']:>12,} "
+                  f"{1 - best / max(sizes['identity'], 1):>7.0%}")
+
+
+if __name__ == "__main__":
+    main()
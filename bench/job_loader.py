@@ -0,0 +1,170 @@
+# bench/job_loader.py
+"""Time the Job Changes loader on a synthetic export.
+
+Builds an N-row file with the real 23-column layout (rows resampled from
+the bundled weekly drop, with fresh profiles and dates), then times the
+original loader (all columns, inferred datetime parsing, to_period weeks)
+against BasicViz.load_data, cold (CSV parse) and warm (Arrow cache).
+With --stream it instead folds the file into a JobChangeTally whole and
+streamed in chunks (BasicViz.stream_data), each in a fresh process,
+checks both against the in-memory builders and reports peak RSS.
+
+    python -m bench.job_loader --rows 3000000
+    python -m bench.job_loader --rows 3000000 --stream
+"""
+import argparse
+import concurrent.futures
+import importlib.util
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+SAMPLE = ROOT / "data" / "livedata-weekly-job-changes-2025-07-23.csv"
+
+
+def make_synthetic(path: Path, rows: int, seed: int = 0) -> Path:
+    rng = np.random.default_rng(seed)
+    base = pd.read_csv(SAMPLE)
+    df = base.iloc[rng.integers(0, len(base), rows)].reset_index(drop=True)
+    df["linkedin"] = df["linkedin"].astype(str) + "-" + pd.Series(np.arange(rows)).astype(str)
+    days = pd.to_datetime("2024-01-01") + pd.to_timedelta(rng.integers(0, 600, rows), unit="D")
+    stamps = days.strftime("%Y-%m-%dT00:00:00Z")
+    df["current_job.started_at"] = stamps
+    df["previous_job.ended_at"] = stamps
+    df.to_csv(path, index=False)
+    return path
+
+
+def original_loader(path: Path) -> pd.DataFrame:
+    """The loader as it was before column projection and the ISO fast path."""
+    df = pd.read_csv(path)
+    df["current_job.started_at"] = pd.to_datetime(df["current_job.started_at"], errors="coerce", utc=True)
+    df["previous_job.ended_at"] = pd.to_datetime(df["previous_job.ended_at"], errors="coerce", utc=True)
+    arrival_mask = df["arrival/departure"].eq("arrival")
+    event_time = df["current_job.started_at"].where(arrival_mask, df["previous_job.ended_at"])
+    df["week"] = event_time.dt.tz_localize(None).dt.to_period("W").dt.start_time
+    return df
+
+
+def page_module():
+    """docs/BasicViz.py without importing the Dash app."""
+    import dash
+    dash.register_page = lambda *a, **k: None
+    spec = importlib.util.spec_from_file_location("bench_basicviz", ROOT / "docs" / "BasicViz.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def page_loader():
+    """BasicViz.load_data without importing the Dash app."""
+    return page_module().load_data
+
+
+def tally_in_child(path: Path, chunk_bytes: int = None):
+    """Tally ``path`` (whole, or streamed when ``chunk_bytes`` is set); run in a fresh process."""
+    from ctba import datasets
+    from ctba.jobchanges import COMPANY, FUNCTION, JobChangeTally
+    datasets.CACHE_ENABLED = False
+    module = page_module()
+    t0 = time.perf_counter()
+    tally = JobChangeTally()
+    chunks = [module.load_data(path)] if chunk_bytes is None else module.stream_data(path, chunk_bytes)
+    for chunk in chunks:
+        tally.add(chunk)
+    seconds = time.perf_counter() - t0
+    results = (tally.company_counts(), tally.function_counts(), tally.weekly_frame())
+    return seconds, peak_rss(), results
+
+
+def peak_rss() -> int:
+    """This process's peak RSS; unlike ru_maxrss, VmHWM isn't inherited from the parent."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+
+
+def in_memory_counts(path: Path):
+    """The page's raw-frame builders on the whole file, for the exactness check."""
+    from ctba.jobchanges import COMPANY, FUNCTION, departure_counts, weekly_counts
+    df = page_module().load_data(path)
+    return departure_counts(df, COMPANY), departure_counts(df, FUNCTION), weekly_counts(df)
+
+
+def same_counts(tally_results, expected) -> bool:
+    companies, functions, weekly = tally_results
+    exp_companies, exp_functions, exp_weekly = expected
+    exp_weekly = exp_weekly.assign(**{"arrival/departure": exp_weekly["arrival/departure"].astype(str)})
+    weekly = weekly.assign(**{"arrival/departure": weekly["arrival/departure"].astype(str)})
+    return (
+        companies.sort_index().to_dict() == exp_companies.sort_index().to_dict()
+        and functions.sort_index().to_dict() == exp_functions.sort_index().to_dict()
+        and weekly.to_dict("records") == exp_weekly.to_dict("records")
+    )
+
+
+def stream_report(path: Path, chunk_mb: list):
+    spawn = multiprocessing.get_context("spawn")
+    runs = [("whole file", None)] + [(f"streamed, {mb} MB chunks", mb << 20) for mb in chunk_mb]
+    expected = in_memory_counts(path)
+    for label, chunk_bytes in runs:
+        with concurrent.futures.ProcessPoolExecutor(1, mp_context=spawn) as pool:
+            seconds, peak, results = pool.submit(tally_in_child, path, chunk_bytes).result()
+        exact = "exact" if same_counts(results, expected) else "MISMATCH"
+        print(f"{label:<32} {seconds:7.2f} s  peak RSS {peak / 2**20:7.0f} MiB  {exact}")
+
+
+def timed(fn, *args, repeat: int = 3):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stream", action="store_true", help="compare whole-file and streamed tallies")
+    parser.add_argument("--chunk-mb", type=int, nargs="+", default=[8, 32, 128])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CTBA_CACHE_DIR"] = str(Path(tmp) / "cache")
+        path = make_synthetic(Path(tmp) / "livedata-weekly-job-changes-synthetic.csv", args.rows)
+        print(f"{args.rows:,} rows, {path.stat().st_size / 1e6:.0f} MB")
+        if args.stream:
+            stream_report(path, args.chunk_mb)
+            return
+
+        t_orig, expected = timed(original_loader, path, repeat=args.repeat)
+        load_data = page_loader()
+        from ctba import datasets
+        datasets.CACHE_ENABLED = False
+        t_cold, got = timed(load_data, path, repeat=args.repeat)
+        datasets.CACHE_ENABLED = True
+        load_data(path)  # build the Arrow copy
+        t_warm, _ = timed(load_data, path, repeat=args.repeat)
+
+        assert got["week"].equals(expected["week"]), "week buckets differ"
+        print(f"original loader      {t_orig:7.2f} s")
+        print(f"load_data (CSV)      {t_cold:7.2f} s  ({t_orig / t_cold:.1f}x)")
+        print(f"load_data (Arrow)    {t_warm:7.2f} s  ({t_orig / t_warm:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+# bench/loadtest.py
+"""Throughput and tail latency of ``gunicorn app:server`` under simulated users.
+
+For each workers x threads configuration, starts gunicorn with Open-Meteo
+and NASA pointed at a stub server (bench.stubs, run as its own process with
+the given latency and error rate), then lets N concurrent users loop over
+sessions: open a page from page_registry (index HTML, routing callback,
+the initial callbacks of its controls), then make a few interactions:
+scrub the electricity year slider or change sector/month, pick a
+happiness year, switch the weather city, choose an APOD date. Each user
+waits ``--think`` seconds between requests (0: as fast as answers come
+back). Requests are replayed from /_dash-dependencies the way the
+browser sends them, so no app code runs in the load generator.
+
+    python -m bench.loadtest --users 20 --duration 30 --configs 1x8 2x8 4x4
+    python -m bench.loadtest --stub-latency 0.3 --stub-error-rate 0.05 --out load.json
+
+Callbacks run inline, the default; CTBA_BACKGROUND=0 is forced because
+background jobs are answered through a per-page-load signed polling
+handle this harness doesn't replay.
+Users are threads in one process; past a few hundred requests per second
+the generator, not the server, becomes the bottleneck.
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from bench.callbacks import git_commit
+from bench.compression import find_props
+from bench.stubs import ROOT
+
+# control id -> prop the user changes, per page path
+INTERACTIONS = {
+    "/electricity": [("year-slider", "value"), ("sector-dropdown", "value"), ("month-dropdown", "value")],
+    "/happy": [("year-dropdown", "value")],
+    "/weather": [("city-dd", "value")],
+    "/nasa-image": [("apod-date", "date")],
+    "/JobChanges": [("jobs-companies", "value"), ("jobs-functions", "value")],
+}
+# how often each page is opened relative to the rest (default 1)
+PAGE_WEIGHTS = {"/electricity": 3, "/happy": 2, "/weather": 2, "/nasa-image": 2}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 120.0, proc=None) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with {proc.returncode}")
+        try:
+            if requests.get(url, timeout=2).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} did not come up in {timeout:.0f} s")
+
+
+def page_paths(node, found=None) -> list:
+    """Every internal link in the app layout (the page_registry navigation)."""
+    found = [] if found is None else found
+    if isinstance(node, dict):
+        href = node.get("href")
+        if isinstance(href, str) and href.startswith("/") and href not in found:
+            found.append(href)
+        for value in node.values():
+            page_paths(value, found)
+    elif isinstance(node, list):
+        for value in node:
+            page_paths(value, found)
+    return found
+
+
+def choices(props: dict, prop: str) -> list:
+    """Values a user can pick for one control, read from its layout props."""
+    if "marks" in props:
+        return [int(v) for v in props["marks"]]
+    if "options" in props:
+        return [o["value"] if isinstance(o, dict) else o for o in props["options"]]
+    if prop == "date":
+        lo = dt.date.fromisoformat(str(props["min_date_allowed"])[:10])
+        hi = dt.date.fromisoformat(str(props["max_date_allowed"])[:10])
+        return [(lo + dt.timedelta(days=d)).isoformat() for d in range((hi - lo).days + 1)]
+    return []
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)  # action -> [(seconds, ok)]
+        self._lock = threading.Lock()
+        self.recording = False
+
+    def add(self, action: str, seconds: float, ok: bool) -> None:
+        if self.recording:
+            with self._lock:
+                self.samples[action].append((seconds, ok))
+
+    def summary(self, elapsed: float) -> dict:
+        def stats(rows):
+            ms = np.array([s for s, _ in rows]) * 1e3
+            errors = sum(not ok for _, ok in rows)
+            return {
+                "requests": len(rows),
+                "errors": errors,
+                "error_rate": errors / len(rows),
+                "rps": len(rows) / elapsed,
+                **{f"p{q}_ms": float(np.percentile(ms, q)) for q in (50, 95, 99)},
+                "max_ms": float(ms.max()),
+            }
+
+        every = [row for rows in self.samples.values() for row in rows]
+        return {
+            "total": stats(every) if every else {},
+            "actions": {a: stats(rows) for a, rows in sorted(self.samples.items())},
+        }
+
+
+class User:
+    """One simulated browser: a keep-alive session and the props of the page it's on."""
+
+    def __init__(self, base: str, deps: list, recorder: Recorder, think: float, seed: int):
+        self.base = base
+        self.deps = deps
+        self.recorder = recorder
+        self.think = think
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.routing = next(d for d in deps if "_pages_content.children" in d["output"])
+        self.props = {}
+
+    def request(self, action: str, method: str, path: str, body=None):
+        t0 = time.perf_counter()
+        try:
+            r = self.session.request(method, self.base + path, json=body, timeout=60)
+            # 204: the callback raised PreventUpdate
+            ok = r.status_code in (200, 204)
+        except requests.RequestException:
+            r, ok = None, False
+        self.recorder.add(action, time.perf_counter() - t0, ok)
+        if self.think:
+            time.sleep(self.rng.expovariate(1 / self.think))
+        return r if ok else None
+
+    def call(self, action: str, dep: dict, changed: list):
+        outputs = [{"id": o.split(".")[0], "property": o.split(".")[1]}
+                   for o in dep["output"].strip(".").split("...")]
+        value = lambda d: self.props.get(d["id"], {}).get(d["property"])  # noqa: E731
+        body = {
+            "output": dep["output"],
+            "outputs": outputs if len(outputs) > 1 else outputs[0],
+            "inputs": [{**i, "value": value(i)} for i in dep["inputs"]],
+            "state": [{**s, "value": value(s)} for s in dep.get("state", [])],
+            "changedPropIds": changed,
+        }
+        return self.request(action, "POST", "/_dash-update-component", body)
+
+    def server_callbacks(self, ids=None, initial=False):
+        for dep in self.deps:
+            if dep.get("clientside_function") or dep is self.routing:
+                continue
+            inputs = {i["id"] for i in dep["inputs"]}
+            if not inputs <= set(self.props):
+                continue
+            if initial and dep.get("prevent_initial_call"):
+                continue
+            if ids is not None and not inputs & ids:
+                continue
+            yield dep
+
+    def open_page(self, path: str) -> None:
+        self.request("index", "GET", "/")
+        body = {
+            "output": self.routing["output"],
+            "outputs": [{"id": "_pages_content", "property": "children"},
+                        {"id": "_pages_store", "property": "data"}],
+            "inputs": [{"id": "_pages_location", "property": "pathname", "value": path},
+                       {"id": "_pages_location", "property": "search", "value": ""}],
+            "changedPropIds": ["_pages_location.pathname"],
+        }
+        r = self.request(f"{path} layout", "POST", "/_dash-update-component", body)
+        self.props = find_props(r.json()["response"]["_pages_content"]["children"]) if r is not None else {}
+        for dep in self.server_callbacks(initial=True):
+            self.call(f"{path} initial", dep, [])
+
+    def interact(self, path: str) -> None:
+        options = [(cid, prop) for cid, prop in INTERACTIONS.get(path, []) if cid in self.props]
+        if not options:
+            return
+        cid, prop = self.rng.choice(options)
+        values = choices(self.props[cid], prop)
+        if not values:
+            return
+        if self.props[cid].get("multi"):
+            self.props[cid][prop] = self.rng.sample(values, min(len(values), self.rng.randint(1, 3)))
+        else:
+            self.props[cid][prop] = self.rng.choice(values)
+        for dep in self.server_callbacks(ids={cid}):
+            self.call(f"{path} {cid}", dep, [f"{cid}.{prop}"])
+
+    def run(self, paths: list, weights: list, stop: threading.Event) -> None:
+        while not stop.is_set():
+            path = self.rng.choices(paths, weights)[0]
+            self.open_page(path)
+            for _ in range(self.rng.randint(1, 5)):
+                if stop.is_set():
+                    break
+                self.interact(path)
+
+
+class Gunicorn:
+    def __init__(self, workers: int, threads: int, env: dict):
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "app:server", "--bind", f"127.0.0.1:{self.port}",
+             "--workers", str(workers), "--threads", str(threads), "--log-level", "warning"],
+            cwd=ROOT, env={**os.environ, **env},
+        )
+
+    def stop(self) -> None:
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def run_config(workers: int, threads: int, args, env: dict) -> dict:
+    server = Gunicorn(workers, threads, env)
+    try:
+        wait_until_up(server.url + "/", proc=server.proc)
+        deps = requests.get(server.url + "/_dash-dependencies", timeout=30).json()
+        layout = requests.get(server.url + "/_dash-layout", timeout=30).json()
+        paths = [p for p in page_paths(layout) if not args.pages or p in args.pages]
+        weights = [PAGE_WEIGHTS.get(p, 1) for p in paths]
+
+        recorder = Recorder()
+        stop = threading.Event()
+        users = [User(server.url, deps, recorder, args.think, seed=i) for i in range(args.users)]
+        threads_ = [threading.Thread(target=u.run, args=(paths, weights, stop), daemon=True) for u in users]
+        for t in threads_:
+            t.start()
+        time.sleep(args.warmup)  # first visits load each worker's datasets
+        recorder.recording = True
+        t0 = time.perf_counter()
+        time.sleep(args.duration)
+        recorder.recording = False
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        for t in threads_:
+            t.join(timeout=60)
+        return {"workers": workers, "threads": threads, "users": args.users, "seconds": elapsed,
+                **recorder.summary(elapsed)}
+    finally:
+        server.stop()
+
+
+def print_result(result: dict, verbose: bool) -> None:
+    total = result["total"]
+    if not total:
+        print(f"{result['workers']}x{result['threads']:<6} no requests completed")
+        return
+    print(f"{result['workers']}x{result['threads']:<6} {result['users']:>5} {total['rps']:>8.1f} "
+          f"{total['error_rate']:>6.1%} {total['p50_ms']:>8.1f} {total['p95_ms']:>8.1f} "
+          f"{total['p99_ms']:>8.1f} {total['max_ms']:>9.1f}")
+    if verbose:
+        for action, s in result["actions"].items():
+            print(f"    {action:<34} {s['requests']:>6} {s['error_rate']:>6.1%} {s['p50_ms']:>8.1f} "
+                  f"{s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="+", default=["1x8", "2x8", "4x4"],
+                        help="gunicorn WORKERSxTHREADS configurations to compare")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds per configuration")
+    parser.add_argument("--warmup", type=float, default=10.0, help="unmeasured seconds before each run")
+    parser.add_argument("--think", type=float, default=0.0, help="mean seconds a user waits between requests")
+    parser.add_argument("--pages", nargs="*", help="only these page paths (default: every page in the navigation)")
+    parser.add_argument("--stub-latency", type=float, default=0.05, help="seconds added to every upstream reply")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="fraction of upstream replies that are 503")
+    parser.add_argument("-v", "--verbose", action="store_true", help="also print every action")
+    parser.add_argument("--out", type=Path, help="write the results as JSON")
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub = subprocess.Popen([sys.executable, "-m", "bench.stubs", "--port", str(stub_port),
+                             "--latency", str(args.stub_latency), "--error-rate", str(args.stub_error_rate)],
+                            cwd=ROOT, stdout=subprocess.DEVNULL)
+    tmp = tempfile.TemporaryDirectory()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    env = {
+        "CTBA_OPEN_METEO_URL": stub_url + "/v1/forecast",
+        "CTBA_APOD_URL": stub_url + "/planetary/apod",
+        "CTBA_APOD_DB": str(Path(tmp.name) / "apod.sqlite"),
+        "CTBA_BACKGROUND": "0",
+    }
+    results = []
+    try:
+        wait_until_up(stub_url + "/", proc=stub)
+        print(f"{args.users} users, {args.duration:.0f} s per configuration, "
+              f"upstream latency {args.stub_latency * 1e3:.0f} ms, error rate {args.stub_error_rate:.0%}")
+        print(f"{'config':<8} {'users':>5} {'req/s':>8} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'max ms':>9}")
+        for config in args.configs:
+            workers, threads = (int(n) for n in config.lower().split("x"))
+            # each configuration starts with closed upstream breakers
+            breakers = {"CTBA_BREAKER_DB": str(Path(tmp.name) / f"breakers-{config}.sqlite")}
+            result = run_config(workers, threads, args, {**env, **breakers})
+            results.append(result)
+            print_result(result, args.verbose)
+    finally:
+        stub.terminate()
+        stub.wait()
+        tmp.cleanup()
+
+    if args.out:
+        report = {
+            "commit": git_commit(),
+            "created": dt.datetime.now().isoformat(timespec="seconds"),
+            "stub_latency": args.stub_latency,
+            "stub_error_rate": args.stub_error_rate,
+            "think": args.think,
+            "results": results,
+        }
+        args.out.write_text(json.dumps(report, indent=2))
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench/outage.py
+"""Page callback latency while Open-Meteo and NASA are down.
+
+Imports the app against bench.stubs, warms the weather forecast, then
+turns the stub into a slow outage (every call waits ``--latency`` seconds
+and answers 503) and times the weather and APOD callbacks with the
+per-host circuit breakers on and off:
+
+* ``weather.update_compare [no data]`` - nothing cached, the call fails,
+* ``weather.update_compare [expired]`` - the forecast is past its stale
+  window, so the last known good one is served once the refetch fails,
+* ``apod.show_apod [new date]`` - a date the local store has not seen.
+
+    python -m bench.outage --calls 10 --latency 1
+"""
+import argparse
+import datetime as dt
+import itertools
+import json
+import time
+from pathlib import Path
+
+from bench.callbacks import page_module, percentile_ms
+from bench.stubs import stubbed_app
+
+
+def time_calls(fn, calls: int) -> list:
+    samples = []
+    for _ in range(calls):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def run(stub, calls: int, latency: float) -> list:
+    from dash import exceptions
+
+    from ctba import upstream
+
+    weather = page_module("/weather")
+    apod_page = page_module("/nasa-image")
+    cache = weather.forecast_cache
+    weather.fetch_all_temps()
+    last_good = cache.peek(weather.ALL_CITIES)
+    ttl = cache.ttl, cache.stale_ttl
+    failures = upstream.BREAKER_FAILURES
+    fresh_dates = ((dt.date(2000, 1, 1) - dt.timedelta(days=i)).isoformat() for i in itertools.count())
+
+    def compare():
+        try:
+            weather.update_compare(None)
+        except exceptions.PreventUpdate:
+            pass
+
+    def no_data():
+        cache.clear()
+        cache.ttl, cache.stale_ttl = ttl
+
+    def expired():
+        cache.put(weather.ALL_CITIES, last_good)
+        cache.ttl = cache.stale_ttl = 0
+
+    cases = [
+        ("weather.update_compare", "no data", no_data, compare),
+        ("weather.update_compare", "expired", expired, compare),
+        ("apod.show_apod", "new date", lambda: None, lambda: apod_page.show_apod(next(fresh_dates))),
+    ]
+    stub.error_rate, stub.latency = 1.0, latency
+    results = []
+    for breaker in (False, True):
+        for name, state, setup, fn in cases:
+            upstream.BREAKER_FAILURES = failures if breaker else 0
+            upstream.guards.clear()  # every case starts with closed breakers
+            upstream.board.clear()
+            setup()
+            sent = stub.requests
+            samples = time_calls(fn, calls)
+            results.append({
+                "name": name,
+                "state": state,
+                "breaker": breaker,
+                "calls": calls,
+                "upstream_requests": stub.requests - sent,
+                "slow_calls": sum(t >= latency for t in samples),  # those that waited on the stub
+                "p50_ms": percentile_ms(samples, 50),
+                "p95_ms": percentile_ms(samples, 95),
+                "max_ms": percentile_ms(samples, 100),
+            })
+    upstream.BREAKER_FAILURES = failures
+    cache.ttl, cache.stale_ttl = ttl
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=10, help="calls per case")
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds the stub takes to answer 503")
+    parser.add_argument("--out", type=Path, help="write results as JSON")
+    args = parser.parse_args()
+
+    with stubbed_app() as (app, stub):
+        results = run(stub, args.calls, args.latency)
+
+    print(f"{'case':<36} {'breaker':>8} {'sent':>6} {'slow':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for r in results:
+        print(f"{r['name'] + ' [' + r['state'] + ']':<36} {'on' if r['breaker'] else 'off':>8} "
+              f"{r['upstream_requests']:>6} {r['slow_calls']:>6} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f} {r['max_ms']:>10.2f}")
+    if args.out:
+        args.out.write_text(json.dumps({"latency": args.latency, "results": results}, indent=2))
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# bench/stubs.py
+"""Local stand-ins for the Open-Meteo and NASA APOD APIs.
+
+Answers the same query shapes the pages send, with configurable latency
+and error rate, so benchmarks and load tests never touch the real APIs:
+
+    stub = StubServer(latency=0.05, error_rate=0.01).start()
+    os.environ["CTBA_OPEN_METEO_URL"] = stub.url + "/v1/forecast"
+    os.environ["CTBA_APOD_URL"] = stub.url + "/planetary/apod"
+
+Run standalone with ``python -m bench.stubs --port 8900``.
+"""
+import argparse
+import contextlib
+import datetime as dt
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def forecast(lat: float, lon: float, hours: int = 48) -> dict:
+    start = dt.datetime.combine(dt.date.today(), dt.time())
+    base = 15 + (lat - 37) * 2 + (lon + 77) * 0.5
+    return {
+        "latitude": lat,
+        "longitude": lon,
+        "hourly": {
+            "time": [(start + dt.timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(hours)],
+            "temperature_2m": [round(base + 6 * ((h % 24) - 12) / 12, 1) for h in range(hours)],
+        },
+    }
+
+
+def apod(date: dt.date) -> dict:
+    return {
+        "date": date.isoformat(),
+        "title": f"Stub picture for {date.isoformat()}",
+        "explanation": "A placeholder served by bench.stubs. " * 8,
+        "media_type": "image",
+        "url": f"https://example.invalid/apod/{date.isoformat()}.jpg",
+    }
+
+
+class StubServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, error_rate: float = 0.0,
+                 apod_gaps=()):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = 503  # what a failed request is answered with
+        self.retry_after = None  # Retry-After header (seconds) sent with it
+        self.apod_gaps = set(apod_gaps)  # days with no APOD, as in the real archive
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body, headers=None) -> None:
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if not url.path.endswith(("/forecast", "/apod")):
+                    return self._send(404, {"error": "not found"})  # also the harnesses' readiness check
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.error_rate and random.random() < stub.error_rate:
+                    headers = {} if stub.retry_after is None else {"Retry-After": str(stub.retry_after)}
+                    return self._send(stub.error_status, {"error": "stubbed upstream failure"}, headers)
+                q = {k: v[0] for k, v in parse_qs(url.query).items()}
+                try:
+                    if url.path.endswith("/forecast"):
+                        lats = [float(x) for x in q["latitude"].split(",")]
+                        lons = [float(x) for x in q["longitude"].split(",")]
+                        body = [forecast(a, b) for a, b in zip(lats, lons)]
+                        return self._send(200, body[0] if len(body) == 1 else body)
+                    if url.path.endswith("/apod"):
+                        if "start_date" in q:
+                            start = dt.date.fromisoformat(q["start_date"])
+                            end = dt.date.fromisoformat(q.get("end_date", dt.date.today().isoformat()))
+                            days = (start + dt.timedelta(days=i) for i in range((end - start).days + 1))
+                            return self._send(200, [apod(d) for d in days if d not in stub.apod_gaps])
+                        date = dt.date.fromisoformat(q.get("date", dt.date.today().isoformat()))
+                        if date in stub.apod_gaps:
+                            return self._send(404, {"code": 404, "msg": f"No data available for date: {date}"})
+                        return self._send(200, apod(date))
+                except (KeyError, ValueError) as e:
+                    return self._send(400, {"error": str(e)})
+                return self._send(404, {"error": "not found"})
+
+        return Handler
+
+    def start(self) -> "StubServer":
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@contextlib.contextmanager
+def stubbed_app(**stub_options):
+    """Import app.py with both APIs pointed at a fresh StubServer; yields (app module, stub)."""
+    stub = StubServer(**stub_options).start()
+    tmp = tempfile.TemporaryDirectory()
+    os.environ.update({
+        "CTBA_OPEN_METEO_URL": stub.url + "/v1/forecast",
+        "CTBA_APOD_URL": stub.url + "/planetary/apod",
+        "CTBA_APOD_DB": str(Path(tmp.name) / "apod.sqlite"),
+        "CTBA_BREAKER_DB": str(Path(tmp.name) / "breakers.sqlite"),
+        "CTBA_WEATHER_PREFETCH": "0",
+    })
+    sys.path.insert(0, str(ROOT))
+    os.chdir(ROOT)
+    import app
+    try:
+        yield app, stub
+    finally:
+        stub.stop()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve stub Open-Meteo/APOD APIs")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    args = parser.parse_args()
+    stub = StubServer(port=args.port, latency=args.latency, error_rate=args.error_rate)
+    print(f"stub APIs on {stub.url}")
+    stub._httpd.serve_forever()
@@ -0,0 +1 @@
+"""Shared helpers for the CTBA Dash pages under docs/."""
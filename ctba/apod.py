@@ -0,0 +1,168 @@
+# ctba/apod.py
+"""Persistent local store for NASA Astronomy Picture of the Day metadata.
+
+Published APOD entries never change, so each one is fetched once and kept
+in a SQLite file keyed by date. Only today's entry (which NASA may still
+be editing) expires, after ``TODAY_TTL`` seconds, and is kept while NASA
+can't be reached. ``backfill`` uses the API's ``start_date``/``end_date``
+range mode to load many days per call, and records each range it
+fetched, so days NASA has no entry for aren't asked for again:
+
+    python -m ctba.apod 1995-06-16 2025-08-01
+"""
+import datetime as dt
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+from ctba.datasets import CACHE_DIR
+from ctba.upstream import make_session
+
+API_KEY = os.environ.get("NASA_API_KEY", "DEMO_KEY")
+APOD_URL = os.environ.get("CTBA_APOD_URL", "https://api.nasa.gov/planetary/apod")
+MIN_DATE = dt.date(1995, 6, 16)
+TODAY_TTL = float(os.environ.get("CTBA_APOD_TODAY_TTL", 3600))
+DB_PATH = Path(os.environ.get("CTBA_APOD_DB", CACHE_DIR / "apod.sqlite"))
+# keep-alive connections to NASA; no retries, a 429 from DEMO_KEY won't clear in seconds
+session = make_session(pool_size=4, retries=0)
+
+
+class ApodStore:
+    """date -> APOD JSON, safe to share between processes.
+
+    The file is created on first use, so an unwritable cache dir only
+    fails the calls that need it.
+    """
+
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with sqlite3.connect(self.path, timeout=10) as con:
+                con.execute("PRAGMA journal_mode=WAL")
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS apod ("
+                    " date TEXT PRIMARY KEY, payload TEXT NOT NULL, fetched_at REAL NOT NULL)"
+                )
+                con.execute("CREATE TABLE IF NOT EXISTS fetched (start TEXT NOT NULL, end TEXT NOT NULL)")
+            self._ready = True
+        return sqlite3.connect(self.path, timeout=10)
+
+    def get(self, date: dt.date):
+        """Return (data, fetched_at) or None."""
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT payload, fetched_at FROM apod WHERE date = ?", (date.isoformat(),)
+            ).fetchone()
+        return None if row is None else (json.loads(row[0]), row[1])
+
+    def put_many(self, entries: list, fetched_at: float = None) -> int:
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        rows = [(e["date"], json.dumps(e), fetched_at) for e in entries if e.get("date")]
+        with self._connect() as con:
+            con.executemany("INSERT OR REPLACE INTO apod VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def dates(self) -> set:
+        with self._connect() as con:
+            return {dt.date.fromisoformat(d) for (d,) in con.execute("SELECT date FROM apod")}
+
+    def mark_fetched(self, start: dt.date, end: dt.date) -> None:
+        """Record that every entry NASA has in [start, end] is stored."""
+        with self._connect() as con:
+            con.execute("INSERT INTO fetched VALUES (?, ?)", (start.isoformat(), end.isoformat()))
+
+    def fetched_days(self) -> set:
+        """Days inside a recorded range, whether NASA published an entry for them or not."""
+        with self._connect() as con:
+            ranges = con.execute("SELECT start, end FROM fetched").fetchall()
+        days = set()
+        for start, end in ranges:
+            start, end = dt.date.fromisoformat(start), dt.date.fromisoformat(end)
+            days.update(start + dt.timedelta(days=i) for i in range((end - start).days + 1))
+        return days
+
+
+store = ApodStore()
+
+
+def is_fresh(date: dt.date, fetched_at: float, now: float = None) -> bool:
+    """An entry fetched after its date ended never expires; any other lasts TODAY_TTL.
+
+    That covers today's entry and one stored on its own day, which may
+    have been partial or corrected later and becomes final only once
+    refetched the day after.
+    """
+    day_end = dt.datetime.combine(date + dt.timedelta(days=1), dt.time()).timestamp()
+    if fetched_at >= day_end:
+        return True
+    now = time.time() if now is None else now
+    return now - fetched_at < TODAY_TTL
+
+
+def get_apod(date: dt.date, session=session, timeout: float = 10) -> dict:
+    """APOD for ``date`` from the local store, fetching it on a miss.
+
+    If the refetch of an expired entry fails, the stored one is returned.
+    Raises ``requests.RequestException`` if there is none and the API fails.
+    """
+    try:
+        cached = store.get(date)
+    except (OSError, sqlite3.Error) as e:
+        print(f"APOD store unavailable, calling the API: {e}")
+        cached = None
+    if cached is not None and is_fresh(date, cached[1]):
+        return cached[0]
+    try:
+        r = session.get(APOD_URL, params={"api_key": API_KEY, "date": date.isoformat()}, timeout=timeout)
+        r.raise_for_status()
+    except requests.RequestException:
+        if cached is None:
+            raise
+        return cached[0]  # last known good
+    data = r.json()
+    data.setdefault("date", date.isoformat())
+    try:
+        store.put_many([data])
+    except (OSError, sqlite3.Error) as e:
+        print(f"Could not store APOD {date}: {e}")
+    return data
+
+
+def backfill(start: dt.date = MIN_DATE, end: dt.date = None, chunk_days: int = 100,
+             session=session, skip_known: bool = True) -> int:
+    """Load every APOD in [start, end] with range requests; return rows stored."""
+    yesterday = dt.date.today() - dt.timedelta(days=1)
+    end = end or yesterday
+    known = store.dates() | store.fetched_days() if skip_known else set()
+    stored = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + dt.timedelta(days=chunk_days - 1), end)
+        span = {chunk_start + dt.timedelta(days=i) for i in range((chunk_end - chunk_start).days + 1)}
+        if not span <= known:
+            r = session.get(
+                APOD_URL,
+                params={"api_key": API_KEY, "start_date": chunk_start.isoformat(),
+                        "end_date": chunk_end.isoformat()},
+                timeout=60,
+            )
+            r.raise_for_status()
+            stored += store.put_many(r.json())
+            if chunk_start <= yesterday:  # today's entry may not be published yet
+                store.mark_fetched(chunk_start, min(chunk_end, yesterday))
+        chunk_start = chunk_end + dt.timedelta(days=1)
+    return stored
+
+
+if __name__ == "__main__":
+    args = [dt.date.fromisoformat(a) for a in sys.argv[1:3]]
+    print(f"stored {backfill(*args)} APOD entries in {store.path}")
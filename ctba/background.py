@@ -0,0 +1,52 @@
+# ctba/background.py
+"""Run slow external-API callbacks as Dash background callbacks.
+
+With CTBA_BACKGROUND=1 a background callback returns from the HTTP
+request at once and runs in a separate process fed by a local diskcache
+queue; the browser polls for the result. Needs the optional
+``diskcache``, ``multiprocess`` and ``psutil`` packages.
+
+It is off by default: every job runs in a freshly forked process whose
+memory is thrown away when it ends, so the forecast cache, request
+coalescing and the upstream circuit breakers (``ctba.upstream``) never
+see the calls it makes. The gthread workers in gunicorn.conf.py already
+keep a slow upstream from pinning a worker; inline callbacks share that
+state with every other request in the worker.
+"""
+import os
+
+from dash import DiskcacheManager, set_props
+from dash.exceptions import MissingCallbackContextException
+
+from ctba.datasets import CACHE_DIR
+
+manager = None
+if os.environ.get("CTBA_BACKGROUND", "0") == "1":
+    try:
+        import diskcache
+
+        manager = DiskcacheManager(diskcache.Cache(str(CACHE_DIR / "background")))
+    except ImportError:
+        manager = None
+    except OSError as e:
+        # read-only checkout: run the callbacks inline
+        print(f"Could not open the background job queue in {CACHE_DIR}: {e}")
+        manager = None
+
+
+def background_options(**kwargs) -> dict:
+    """Extra ``@callback`` kwargs that make it a background job, or {} if unavailable.
+
+    Pass background-only options such as ``cancel`` through here.
+    """
+    if manager is None:
+        return {}
+    return {"background": True, "manager": manager, "interval": 500, **kwargs}
+
+
+def report(component_id: str, **props) -> None:
+    """``set_props`` for progress messages; a no-op when called outside a callback."""
+    try:
+        set_props(component_id, props)
+    except MissingCallbackContextException:
+        pass
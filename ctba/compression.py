@@ -0,0 +1,228 @@
+# ctba/compression.py
+"""gzip/brotli compression for callback responses and static files.
+
+Callback responses (``_dash-update-component`` and the other JSON
+endpoints) are compressed per request at a fast setting. Static bodies —
+files under assets/ and the ``_dash-component-suites`` bundles — never
+change for a given deploy, so they are compressed once at the highest
+setting, kept in memory by content hash and written to
+``CACHE_DIR/compressed`` so later workers and restarts just read them
+back.
+
+The highest setting is slow (brotli-11 takes seconds on the Plotly
+bundle), so it never runs on a request or at import. Until a variant is
+on disk, a static body is sent at the fast setting and the variant is
+built in a background thread. Each worker starts ``precompress(app)`` in
+that thread on its first request. A file lock per variant makes one
+worker build it while the others wait and read the result. Run
+``python -m ctba.compression`` in the build step to have every variant
+ready before the first worker starts.
+
+Brotli is used when the ``brotli`` package is installed and the browser
+accepts it, gzip otherwise.
+"""
+import gzip
+import hashlib
+import os
+import pkgutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from flask import request
+
+from ctba.datasets import CACHE_DIR, _write_atomic
+from ctba.store import _FileLock
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+ENABLED = os.environ.get("CTBA_COMPRESS", "1") == "1"
+# Bodies smaller than this go out as-is; the headers would eat the saving
+MIN_BYTES = int(os.environ.get("CTBA_COMPRESS_MIN_BYTES", 1024))
+ENCODINGS = ["br", "gzip"] if brotli else ["gzip"]
+STATIC_PREFIXES = ("/_dash-component-suites/", "/assets/")
+COMPRESSIBLE = {"application/json", "application/javascript", "text/javascript", "text/css",
+                "text/html", "text/plain", "image/svg+xml"}
+
+
+def encode(data: bytes, encoding: str, static: bool = False) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11 if static else 5)
+    return gzip.compress(data, compresslevel=9 if static else 6, mtime=0)
+
+
+class StaticVariants:
+    """Compressed copies of static bodies, keyed by content hash and encoding."""
+
+    def __init__(self, disk_dir=None):
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._variants: dict[tuple, bytes] = {}
+        self._interim: dict[tuple, bytes] = {}  # fast-setting stand-ins while a variant builds
+        self._pending = set()
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(data: bytes, encoding: str) -> tuple:
+        return hashlib.blake2b(data, digest_size=16).hexdigest(), encoding
+
+    def _path(self, key: tuple):
+        return self.disk_dir / f"{key[0]}.{key[1]}" if self.disk_dir else None
+
+    def _read(self, key: tuple):
+        path = self._path(key)
+        if path is None:
+            return None
+        try:
+            body = path.read_bytes()
+        except OSError:
+            return None
+        with self._lock:
+            self._variants[key] = body
+            self._interim.pop(key, None)
+        return body
+
+    def get(self, data: bytes, encoding: str) -> bytes:
+        """The best variant available now; a missing one is built in the background."""
+        key = self.key(data, encoding)
+        body = self._variants.get(key)
+        if body is None:
+            body = self._read(key)
+        if body is not None:
+            return body
+        self._submit(key, data)
+        body = self._interim.get(key)
+        if body is None:
+            body = encode(data, encoding)
+            with self._lock:
+                if key not in self._variants:
+                    self._interim[key] = body
+        return body
+
+    def _submit(self, key: tuple, data: bytes) -> None:
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if self._pool_pid != os.getpid():  # a forked child doesn't inherit the thread
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ctba-compress")
+                self._pool_pid = os.getpid()
+            pool = self._pool
+        pool.submit(self.build, data, key[1])
+
+    def build(self, data: bytes, encoding: str) -> bytes:
+        """Make the highest-setting variant, once per instance (blocking)."""
+        key = self.key(data, encoding)
+        body = self._variants.get(key) or self._read(key)
+        path = self._path(key)
+        if body is None and path is not None:
+            try:
+                with _FileLock(path.with_name(f".{path.name}.lock")):
+                    body = self._read(key)  # another worker may have built it meanwhile
+                    if body is None:
+                        body = encode(data, encoding, static=True)
+                        _write_atomic(path, body)
+            except OSError:
+                pass  # read-only checkout: keep the in-memory copy only
+        if body is None:
+            body = encode(data, encoding, static=True)
+        with self._lock:
+            self._variants[key] = body
+            self._interim.pop(key, None)
+            self._pending.discard(key)
+        return body
+
+    def memory_bytes(self) -> int:
+        return sum(map(len, self._variants.values())) + sum(map(len, self._interim.values()))
+
+    def stats(self) -> dict:
+        return {"entries": len(self._variants), "interim": len(self._interim), "bytes": self.memory_bytes()}
+
+
+variants = StaticVariants(disk_dir=CACHE_DIR / "compressed")
+
+
+def compress_response(response):
+    if (response.status_code != 200 or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE and not response.mimetype.startswith("text/")):
+        return response
+    static = request.path.startswith(STATIC_PREFIXES)
+    if response.direct_passthrough:
+        if not static:
+            return response
+        response.direct_passthrough = False  # send_from_directory: read the file so it can be encoded
+    elif response.is_streamed:
+        return response
+
+    data = response.get_data()
+    if len(data) < MIN_BYTES:
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+
+    body = variants.get(data, encoding) if static else encode(data, encoding)
+    if len(body) >= len(data):
+        return response
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)  # same resource, different bytes per encoding
+    return response
+
+
+def static_files(dash_app):
+    """Bodies of every asset and registered bundle (source maps excluded)."""
+    client = dash_app.server.test_client()
+    client.get(dash_app.config.requests_pathname_prefix)  # registers the bundles the index needs
+    for package, paths in dash_app.registered_paths.items():
+        for path in sorted(paths):
+            if not path.endswith(".map"):
+                data = pkgutil.get_data(package, path)
+                if data:
+                    yield f"{package}/{path}", data
+    assets = Path(dash_app.config.assets_folder)
+    if assets.is_dir():
+        for path in sorted(assets.rglob("*")):
+            if path.is_file():
+                yield str(path.relative_to(assets)), path.read_bytes()
+
+
+def precompress(dash_app) -> int:
+    """Build every static variant ahead of the first visitor (blocking); returns the files covered."""
+    count = 0
+    for _, data in static_files(dash_app):
+        if len(data) >= MIN_BYTES:
+            for encoding in ENCODINGS:
+                variants.build(data, encoding)
+            count += 1
+    return count
+
+
+def install(dash_app) -> None:
+    if not ENABLED:
+        return
+    dash_app.server.after_request(compress_response)
+    started = set()  # pids: gunicorn may fork workers after import
+
+    @dash_app.server.before_request
+    def start_precompress():
+        if os.getpid() not in started:
+            started.add(os.getpid())
+            threading.Thread(target=precompress, args=(dash_app,), name="ctba-precompress", daemon=True).start()
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault("CTBA_WEATHER_PREFETCH", "0")
+    import app
+
+    print(f"compressed {precompress(app.app)} static files into {variants.disk_dir}")
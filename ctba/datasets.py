@@ -0,0 +1,209 @@
+# ctba/datasets.py
+"""Columnar on-disk cache for the CSV files under data/.
+
+The first load of a CSV parses it with pandas and writes an Arrow IPC
+(Feather v2) copy to ``data/.cache``. Later loads memory-map that file
+instead of re-parsing text. A cached copy is reused while the source
+file's mtime and size are unchanged; if they changed, the SHA-256 of the
+source decides whether it is rebuilt.
+
+Each file is parsed with the compact dtypes in ``DTYPE_POLICY``
+(categoricals for repeated labels, narrow integers, float32 for columns
+that are neither summed nor displayed), and the Arrow copy keeps them.
+
+Files too large to read whole are streamed with ``read_csv_chunks``.
+
+pyarrow is optional: without it everything falls back to ``pd.read_csv``.
+"""
+import fnmatch
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+CACHE_DIR = Path(os.environ.get("CTBA_CACHE_DIR", DATA_DIR / ".cache"))
+CACHE_ENABLED = os.environ.get("CTBA_DATA_CACHE", "1") != "0"
+
+# file name pattern -> read_csv dtype mapping. revenue/sales stay float64
+# (the price cube sums them) and so do happiness scores (shown on hover).
+DTYPE_POLICY = {
+    "electricity_prices.csv": {
+        "year": "int16",
+        "month": "int8",
+        "state": "category",
+        "sectorName": "category",
+        "price": "float32",
+    },
+    "world_happiness.csv": {
+        "country": "category",
+        "region": "category",
+        "happiness_rank": "int16",
+        "year": "int16",
+    },
+    "livedata-weekly-job-changes-*.csv": {
+        "arrival/departure": "category",
+        "current_job.company.name": "category",
+        "current_job.function": "category",
+        "current_job.level": "category",
+        "previous_job.company.name": "category",
+        "previous_job.function": "category",
+        "previous_job.level": "category",
+    },
+}
+
+
+def dtype_policy(path) -> dict:
+    for pattern, dtypes in DTYPE_POLICY.items():
+        if fnmatch.fnmatch(Path(path).name, pattern):
+            return dtypes
+    return {}
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_paths(path: Path, **read_csv_kwargs) -> tuple[Path, Path]:
+    """Return (arrow_file, meta_file) for ``path`` read with these kwargs."""
+    key = hashlib.sha1(json.dumps(read_csv_kwargs, sort_keys=True, default=str).encode()).hexdigest()[:8]
+    stem = f"{Path(path).stem}-{key}"
+    return CACHE_DIR / f"{stem}.arrow", CACHE_DIR / f"{stem}.meta.json"
+
+
+def _is_fresh(path: Path, arrow_path: Path, meta_path: Path) -> bool:
+    if not (arrow_path.exists() and meta_path.exists()):
+        return False
+    try:
+        meta = json.loads(meta_path.read_text())
+    except (OSError, ValueError):
+        return False
+    st = path.stat()
+    if meta.get("mtime_ns") == st.st_mtime_ns and meta.get("size") == st.st_size:
+        return True
+    # mtime moved (fresh checkout, touch, copy): trust the content hash
+    if meta.get("sha256") != _sha256(path):
+        return False
+    meta.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+    _write_atomic(meta_path, json.dumps(meta).encode())
+    return True
+
+
+def _write_atomic(target: Path, payload: bytes) -> None:
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, target)
+
+
+def _write_cache(df: pd.DataFrame, path: Path, arrow_path: Path, meta_path: Path) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = arrow_path.with_name(f".{arrow_path.name}.{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, arrow_path)
+    st = path.stat()
+    meta = {"source": str(path), "mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": _sha256(path)}
+    _write_atomic(meta_path, json.dumps(meta).encode())
+
+
+def read_arrow(arrow_path: Path) -> pd.DataFrame:
+    with pa.memory_map(str(arrow_path), "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def _typed_kwargs(path: Path, read_csv_kwargs: dict) -> dict:
+    """``read_csv_kwargs`` with the file's ``DTYPE_POLICY`` entry merged in."""
+    read_csv_kwargs = dict(read_csv_kwargs)
+    if read_csv_kwargs.get("engine") == "pyarrow" and pa is None:
+        del read_csv_kwargs["engine"]
+    policy = {**dtype_policy(path), **read_csv_kwargs.get("dtype", {})}
+    if "usecols" in read_csv_kwargs:
+        policy = {c: t for c, t in policy.items() if c in read_csv_kwargs["usecols"]}
+    if policy:
+        read_csv_kwargs["dtype"] = policy
+    return read_csv_kwargs
+
+
+def read_csv_typed(path, **read_csv_kwargs) -> pd.DataFrame:
+    """``pd.read_csv`` with the file's ``DTYPE_POLICY`` applied, and no cache.
+
+    For callers that keep the result in a cache of their own (ctba.store).
+    """
+    return pd.read_csv(path, **_typed_kwargs(Path(path), read_csv_kwargs))
+
+
+def read_csv_cached(path, **read_csv_kwargs) -> pd.DataFrame:
+    """Drop-in for ``pd.read_csv(path, **kwargs)`` backed by the Arrow cache.
+
+    The file's ``DTYPE_POLICY`` entry is applied, with any ``dtype``
+    passed in taking precedence per column.
+    ``engine="pyarrow"`` (multithreaded parsing) quietly falls back to the
+    default parser when pyarrow isn't installed.
+    """
+    path = Path(path)
+    read_csv_kwargs = _typed_kwargs(path, read_csv_kwargs)
+    if pa is None or not CACHE_ENABLED:
+        return pd.read_csv(path, **read_csv_kwargs)
+
+    arrow_path, meta_path = cache_paths(path, **read_csv_kwargs)
+    try:
+        if _is_fresh(path, arrow_path, meta_path):
+            return read_arrow(arrow_path)
+    except (OSError, pa.ArrowException) as e:
+        print(f"Ignoring unreadable cache {arrow_path}: {e}")
+
+    df = pd.read_csv(path, **read_csv_kwargs)
+    try:
+        _write_cache(df, path, arrow_path, meta_path)
+    except (OSError, pa.ArrowException) as e:
+        # read-only filesystem, mixed-type object columns, ...
+        print(f"Could not write dataset cache for {path.name}: {e}")
+    return df
+
+
+def read_csv_chunks(path, usecols=None, dtype=None, chunk_bytes: int = 32 << 20):
+    """``pd.read_csv(path, usecols=...)`` as frames of about ``chunk_bytes`` of CSV each.
+
+    Only one chunk is parsed at a time, so memory doesn't grow with the
+    file, and nothing is cached. Every column is read as text (types
+    inferred chunk by chunk could disagree) and then cast with the file's
+    ``DTYPE_POLICY`` and ``dtype``. This uses pandas' chunked parser:
+    Arrow's streaming reader parses ahead of its consumer without bound.
+    """
+    path = Path(path)
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in header if usecols is None or c in usecols]
+    dtypes = {c: t for c, t in {**dtype_policy(path), **(dtype or {})}.items() if c in usecols}
+    with open(path, "rb") as f:
+        sample = f.read(1 << 16)
+    rows = max(chunk_bytes * max(sample.count(b"\n"), 1) // max(len(sample), 1), 1)
+    for chunk in pd.read_csv(path, usecols=usecols, dtype=str, chunksize=rows):
+        yield chunk.astype(dtypes) if dtypes else chunk
+
+
+if __name__ == "__main__":
+    # Build what the pages read (the ctba.store frames or SQLite tables of
+    # the active CTBA_BACKEND, and the job drops' Arrow copies) by loading
+    # their datasets the way the pages do
+    import sys
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault("CTBA_WEATHER_PREFETCH", "0")
+    import app  # noqa: F401  registers the pages' datasets
+    from ctba.lazy import load_all
+
+    for name in load_all():
+        print(f"loaded {name}")
+    print(f"cache in {CACHE_DIR}")
@@ -0,0 +1,42 @@
+# ctba/downsample.py
+"""Shape-preserving downsampling for line charts.
+
+``lttb`` implements Largest-Triangle-Three-Buckets (Steinarsson, 2013):
+the first and last points are kept and every bucket in between
+contributes the point that forms the largest triangle with the point
+kept from the previous bucket and the mean of the next one, so peaks,
+dips and trend changes survive where plain striding would drop them.
+"""
+import numpy as np
+import pandas as pd
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Positions of the ``n_out`` points LTTB keeps from (x, y); x must be sorted."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+    # bucket edges over the points between the fixed first and last ones
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def lttb(x, y, n_out: int):
+    """(x, y) reduced to at most ``n_out`` points; datetimes are handled as integers."""
+    x = pd.Series(x)
+    y = pd.Series(y)
+    xs = x.astype("int64") if pd.api.types.is_datetime64_any_dtype(x) else x
+    idx = lttb_indices(xs.to_numpy(), y.to_numpy(), n_out)
+    return x.iloc[idx].reset_index(drop=True), y.iloc[idx].reset_index(drop=True)
@@ -0,0 +1,165 @@
+# ctba/figcache.py
+"""Bounded LRU cache of serialized callback figures.
+
+Callbacks such as ``update_map`` are pure functions of their inputs, so
+the Plotly JSON they produce can be kept and replayed. Entries are stored
+as JSON text (what Dash would send anyway), bounded by entry count and
+total bytes, and optionally mirrored to a local directory so every
+gunicorn worker on the instance shares one warm set. The mirror is kept
+under ``disk_max_bytes`` by deleting its least recently used files.
+
+A memoized callback returns plain dicts/lists decoded from the cached
+JSON instead of ``go.Figure`` objects; Dash serializes both the same way.
+Pass ``memoize(name, version=...)`` the page's data and code version
+(its ``static_key``: the CSV's ``source_key`` and a ``code_key`` of the
+page) so figures of an older CSV or an older deploy, still on disk, are
+never replayed.
+"""
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from plotly.io.json import to_json_plotly
+
+
+class FigureCache:
+    def __init__(self, maxsize: int = 256, max_bytes: int = 64 << 20, disk_dir=None, disk_max_bytes: int = 256 << 20):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_bytes = None  # this process's estimate of the mirror's size
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
+
+    @staticmethod
+    def make_key(name: str, args: tuple, kwargs: dict, version: str = "") -> str:
+        return json.dumps([name, version, args, sorted(kwargs.items())], default=str)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / (hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def get(self, key: str):
+        """Return the cached JSON text for ``key`` or None."""
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return payload
+        if self.disk_dir is not None:
+            path = self._disk_path(key)
+            try:
+                payload = path.read_text()
+                os.utime(path)  # recently used: pruned last
+            except OSError:
+                payload = None
+            if payload is not None:
+                self._store(key, payload)
+                with self._lock:
+                    self.disk_hits += 1
+                return payload
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _store(self, key: str, payload: str) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = payload
+            self._bytes += len(payload)
+            while len(self._entries) > self.maxsize or (self._bytes > self.max_bytes and len(self._entries) > 1):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def put(self, key: str, payload: str) -> None:
+        self._store(key, payload)
+        if self.disk_dir is not None:
+            try:
+                self.disk_dir.mkdir(parents=True, exist_ok=True)
+                target = self._disk_path(key)
+                tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+                tmp.write_text(payload)
+                os.replace(tmp, target)
+                if self._disk_bytes is None or self._disk_bytes + len(payload) > self.disk_max_bytes:
+                    self._prune_disk()
+                else:
+                    self._disk_bytes += len(payload)
+            except OSError as e:
+                print(f"Figure cache: could not write {self.disk_dir}: {e}")
+
+    def _prune_disk(self) -> None:
+        """Delete the least recently used mirror files down to 3/4 of ``disk_max_bytes``.
+
+        Every worker writes to the mirror, so its size is re-read from the
+        directory here rather than trusted from this process's count.
+        """
+        files = []
+        for path in self.disk_dir.glob("*.json"):
+            with contextlib.suppress(OSError):
+                st = path.stat()
+                files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        if total > self.disk_max_bytes:
+            for _, size, path in sorted(files):
+                if total <= self.disk_max_bytes * 3 // 4:
+                    break
+                with contextlib.suppress(OSError):
+                    path.unlink()
+                total -= size
+        self._disk_bytes = total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def memoize(self, name: str, version=None):
+        """Decorator: cache a callback's return value under (name, version, inputs).
+
+        ``version`` is called on every lookup and returns the data version.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = self.make_key(name, args, kwargs, version() if version else "")
+                payload = self.get(key)
+                if payload is None:
+                    payload = to_json_plotly(func(*args, **kwargs))
+                    self.put(key, payload)
+                # multi-output tuples come back as lists, which Dash accepts
+                return json.loads(payload)
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+
+figure_cache = FigureCache(
+    maxsize=int(os.environ.get("CTBA_FIGCACHE_SIZE", 256)),
+    disk_dir=os.environ.get("CTBA_FIGCACHE_DIR") or None,
+    disk_max_bytes=int(os.environ.get("CTBA_FIGCACHE_DISK_BYTES", 256 << 20)),
+)
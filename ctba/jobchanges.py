@@ -0,0 +1,398 @@
+# ctba/jobchanges.py
+"""Incremental tallies over the weekly LinkedIn job-change CSV drops.
+
+New ``livedata-weekly-job-changes-*.csv`` files land in data/ every week.
+``JobChangeWatcher`` notices them and folds only the new files into a
+``JobChangeTally`` of (week, direction, company/function) counts, which
+also answers the page's week/company/function filters. Earlier files are
+never re-read, and rows already seen in an earlier drop are skipped.
+``SQLJobChangeTally`` answers the same queries from the ``ctba.sqldb``
+database instead (CTBA_BACKEND=sqlite), which also records the drops
+already ingested, so no worker re-reads them after a restart.
+"""
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ctba.sqldb import placeholders
+
+DIRECTION = "arrival/departure"
+COMPANY = "previous_job.company.name"
+FUNCTION = "previous_job.function"
+STARTED = "current_job.started_at"
+ENDED = "previous_job.ended_at"
+# Columns that identify one person's job change across overlapping drops
+IDENTITY = [
+    DIRECTION,
+    "linkedin",
+    "current_job.company.name",
+    STARTED,
+    COMPANY,
+    ENDED,
+]
+# Everything the page reads out of the 23-column export
+USECOLS = [DIRECTION, COMPANY, FUNCTION, STARTED, ENDED, "linkedin", "current_job.company.name"]
+
+
+# The unit pandas gives parsed strings (ns on pandas 2, us on pandas 3).
+# Arrow's CSV reader yields seconds, so its output is cast to match.
+_PARSED_DTYPE = pd.to_datetime(pd.Series(["2000-01-01T00:00:00Z"]), utc=True).dtype
+
+
+def parse_utc(values: pd.Series) -> pd.Series:
+    """UTC timestamps from the export's ``2025-06-01T00:00:00Z`` stamps.
+
+    Columns the Arrow CSV reader already parsed are only normalised;
+    text goes through pandas' fixed ISO-8601 fast path.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        utc = values.dt.tz_localize("UTC") if values.dt.tz is None else values.dt.tz_convert("UTC")
+        return utc.astype(_PARSED_DTYPE)
+    return pd.to_datetime(values, errors="coerce", utc=True, format="ISO8601")
+
+
+def week_start(ts: pd.Series) -> pd.Series:
+    """Monday 00:00 of each timestamp's week (same as ``to_period("W").start_time``).
+
+    Works on whole days since the epoch: 1970-01-01 was a Thursday, so
+    ``(days + 3) % 7`` is the number of days since the preceding Monday.
+    """
+    naive = ts.dt.tz_localize(None) if ts.dt.tz is not None else ts
+    days = naive.to_numpy(dtype="datetime64[D]").astype("int64")
+    weeks = (days - (days + 3) % 7).astype("datetime64[D]")
+    weeks[naive.isna().to_numpy()] = np.datetime64("NaT")
+    return pd.Series(weeks, index=ts.index).astype(naive.dtype)
+
+
+def row_keys(df: pd.DataFrame) -> pd.Series:
+    cols = [c for c in IDENTITY if c in df.columns] or list(df.columns)
+    return pd.util.hash_pandas_object(df[cols], index=False)
+
+
+def departure_counts(df: pd.DataFrame, column: str) -> pd.Series:
+    deps = df[df[DIRECTION] == "departure"]
+    return deps[column].dropna().astype(object).value_counts()
+
+
+def weekly_counts(df: pd.DataFrame) -> pd.DataFrame:
+    """One row per (week, direction) with its ``count``."""
+    return df.groupby(["week", DIRECTION], observed=True).size().reset_index(name="count")
+
+
+class KeySet:
+    """Row hashes seen so far, 8 bytes each.
+
+    Kept as sorted uint64 runs; adding a run merges it with the previous
+    one while that is no larger, so there are O(log n) runs to search.
+    """
+
+    def __init__(self):
+        self.runs = []
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            pos = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            found |= run[pos] == keys
+        return found
+
+    def add(self, keys: np.ndarray) -> None:
+        """Add distinct ``keys``, none of which may be in the set already."""
+        if not len(keys):
+            return
+        self.runs.append(np.sort(keys))
+        while len(self.runs) > 1 and len(self.runs[-2]) <= len(self.runs[-1]):
+            newer, older = self.runs.pop(), self.runs.pop()
+            # timsort finds the two sorted runs and merges them in linear time
+            self.runs.append(np.sort(np.concatenate([older, newer]), kind="stable"))
+
+    def memory_bytes(self) -> int:
+        return sum(run.nbytes for run in self.runs)
+
+
+class JobChangeTally:
+    """Pre-aggregated counts that filters are answered from.
+
+    Three count tables, each with a ``count`` column:
+
+    * ``by_company``  -- (week, direction, previous company)
+    * ``by_function`` -- (week, direction, previous function)
+    * ``joint``       -- (week, direction, company, function), only used
+      when a query filters on both companies and functions
+
+    Missing keys stay NaN/NaT so every raw row is represented. Adding a
+    drop merges its counts into the tables; raw rows are not kept.
+    """
+
+    KEYS = {
+        "by_company": ["week", DIRECTION, COMPANY],
+        "by_function": ["week", DIRECTION, FUNCTION],
+        "joint": ["week", DIRECTION, COMPANY, FUNCTION],
+    }
+
+    def __init__(self):
+        for name, keys in self.KEYS.items():
+            setattr(self, name, pd.DataFrame(columns=keys + ["count"]))
+        self.seen = KeySet()
+        self.rows = 0
+
+    def ingested(self) -> dict:
+        return {}  # the counts live in this process only
+
+    def mark_ingested(self, file: str, sig: tuple) -> None:
+        pass
+
+    def add(self, df: pd.DataFrame) -> int:
+        """Fold a loaded frame in, skipping rows already counted; return rows added."""
+        if df.empty:
+            return 0
+        keys = row_keys(df).to_numpy()
+        fresh = ~self.seen.contains(keys) & ~pd.Series(keys).duplicated().to_numpy()
+        df = df[fresh]
+        self.seen.add(keys[fresh])
+        for name, cols in self.KEYS.items():
+            counts = df.groupby(cols, dropna=False, observed=True).size().reset_index(name="count")
+            merged = pd.concat([getattr(self, name), counts], ignore_index=True) if self.rows else counts
+            merged = merged.groupby(cols, dropna=False, sort=False, observed=True)["count"].sum().reset_index()
+            setattr(self, name, merged)
+        self.rows += len(df)
+        return len(df)
+
+    def memory_bytes(self) -> int:
+        tables = sum(int(getattr(self, name).memory_usage(deep=True).sum()) for name in self.KEYS)
+        return tables + self.seen.memory_bytes()
+
+    def week_bounds(self):
+        weeks = self.by_company["week"].dropna()
+        return (weeks.min(), weeks.max()) if len(weeks) else (None, None)
+
+    def companies(self) -> list:
+        return sorted(self.by_company[COMPANY].dropna().unique().tolist())
+
+    def functions(self) -> list:
+        return sorted(self.by_function[FUNCTION].dropna().unique().tolist())
+
+    def _select(self, table, weeks=None, companies=None, functions=None, direction=None):
+        mask = pd.Series(True, index=table.index)
+        if weeks is not None:
+            mask &= table["week"].between(*weeks)
+        if direction is not None:
+            mask &= table[DIRECTION] == direction
+        if companies:
+            mask &= table[COMPANY].isin(companies)
+        if functions:
+            mask &= table[FUNCTION].isin(functions)
+        return table[mask]
+
+    def company_counts(self, weeks=None, companies=None, functions=None) -> pd.Series:
+        """Departures per previous company."""
+        table = self.joint if functions else self.by_company
+        sel = self._select(table, weeks, companies, functions, direction="departure")
+        return sel.groupby(COMPANY, observed=True)["count"].sum().astype("int64")
+
+    def function_counts(self, weeks=None, companies=None, functions=None) -> pd.Series:
+        """Departures per previous job function."""
+        table = self.joint if companies else self.by_function
+        sel = self._select(table, weeks, companies, functions, direction="departure")
+        return sel.groupby(FUNCTION, observed=True)["count"].sum().astype("int64")
+
+    def weekly_frame(self, weeks=None, companies=None, functions=None) -> pd.DataFrame:
+        """One row per (week, direction) with its ``count``, like ``weekly_counts``."""
+        if companies and functions:
+            table = self.joint
+        elif functions:
+            table = self.by_function
+        else:
+            table = self.by_company
+        sel = self._select(table, weeks, companies, functions)
+        wk = sel.groupby(["week", DIRECTION], observed=True)["count"].sum().astype("int64").reset_index()
+        wk["week"] = pd.to_datetime(wk["week"])
+        return wk
+
+
+class SQLJobChangeTally:
+    """``JobChangeTally`` kept in a ``ctba.sqldb.QueryDB``.
+
+    Every distinct job change is one row of (key, week, direction, company,
+    function), keyed by ``row_keys`` so a row seen in an earlier drop (or
+    ingested by another worker) is ignored; the filters are answered with
+    indexed COUNT queries. Rows stay in the database across restarts.
+    """
+
+    WEEK_FORMAT = "%Y-%m-%d %H:%M:%S"  # sorts and compares like the timestamps
+
+    def __init__(self, db, name: str = "job_changes"):
+        self.db = db
+        self.name = name
+        with db.connect() as con:
+            con.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} "
+                "(key INTEGER PRIMARY KEY, week TEXT, direction TEXT, company TEXT, function TEXT)"
+            )
+            for cols in [("direction", "week"), ("company", "week"), ("function", "week")]:
+                con.execute(f"CREATE INDEX IF NOT EXISTS {name}_{'_'.join(cols)} ON {name} ({', '.join(cols)})")
+
+    def add(self, df: pd.DataFrame) -> int:
+        """Insert a loaded frame's rows that aren't stored yet; return rows added."""
+        if df.empty:
+            return 0
+        rows = pd.DataFrame({
+            "key": row_keys(df).to_numpy().view("int64"),
+            "week": df["week"].dt.strftime(self.WEEK_FORMAT),
+            "direction": df[DIRECTION],
+            "company": df[COMPANY],
+            "function": df[FUNCTION],
+        }).astype(object)
+        rows = rows.where(rows.notna(), None)
+        con = self.db.connect()
+        with con:
+            before = con.total_changes
+            con.executemany(f"INSERT OR IGNORE INTO {self.name} VALUES (?, ?, ?, ?, ?)",
+                            rows.itertuples(index=False, name=None))
+            return con.total_changes - before
+
+    @property
+    def rows(self) -> int:
+        return self.db.connect().execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+
+    def memory_bytes(self) -> int:
+        return sys.getsizeof(self)  # the counts live in the database file
+
+    def ingested(self) -> dict:
+        """file name -> (mtime_ns, size) of every drop stored, by any process.
+
+        Recorded in the database's ``ctba_tables`` as ``<table>/<file>``, so
+        a worker starting on an existing database reads no drop twice.
+        """
+        prefix = f"{self.name}/"
+        rows = self.db.connect().execute(
+            "SELECT name, key FROM ctba_tables WHERE substr(name, 1, ?) = ?", (len(prefix), prefix)
+        ).fetchall()
+        return {name[len(prefix):]: tuple(int(v) for v in key.split(":")) for name, key in rows}
+
+    def mark_ingested(self, file: str, sig: tuple) -> None:
+        con = self.db.connect()
+        with con:
+            con.execute("INSERT OR REPLACE INTO ctba_tables VALUES (?, ?)",
+                        (f"{self.name}/{file}", ":".join(str(v) for v in sig)))
+
+    def week_bounds(self):
+        lo, hi = self.db.connect().execute(f"SELECT MIN(week), MAX(week) FROM {self.name}").fetchone()
+        return (pd.Timestamp(lo), pd.Timestamp(hi)) if lo is not None else (None, None)
+
+    def _names(self, column: str) -> list:
+        sql = f"SELECT DISTINCT {column} FROM {self.name} WHERE {column} IS NOT NULL ORDER BY {column}"
+        return [name for (name,) in self.db.connect().execute(sql)]
+
+    def companies(self) -> list:
+        return self._names("company")
+
+    def functions(self) -> list:
+        return self._names("function")
+
+    def _where(self, weeks=None, companies=None, functions=None, direction=None):
+        clauses, params = [], []
+        if weeks is not None:
+            clauses.append("week BETWEEN ? AND ?")
+            params += [pd.Timestamp(w).strftime(self.WEEK_FORMAT) for w in weeks]
+        if direction is not None:
+            clauses.append("direction = ?")
+            params.append(direction)
+        if companies:
+            clauses.append(f"company IN ({placeholders(companies)})")
+            params += list(companies)
+        if functions:
+            clauses.append(f"function IN ({placeholders(functions)})")
+            params += list(functions)
+        return " AND ".join(clauses) or "1", params
+
+    def _counts(self, column: str, label: str, weeks, companies, functions) -> pd.Series:
+        where, params = self._where(weeks, companies, functions, direction="departure")
+        d = self.db.query(
+            f"SELECT {column}, COUNT(*) AS count FROM {self.name} "
+            f"WHERE {where} AND {column} IS NOT NULL GROUP BY {column} ORDER BY {column}",
+            params,
+        )
+        return d.set_index(column)["count"].rename_axis(label).astype("int64")
+
+    def company_counts(self, weeks=None, companies=None, functions=None) -> pd.Series:
+        """Departures per previous company."""
+        return self._counts("company", COMPANY, weeks, companies, functions)
+
+    def function_counts(self, weeks=None, companies=None, functions=None) -> pd.Series:
+        """Departures per previous job function."""
+        return self._counts("function", FUNCTION, weeks, companies, functions)
+
+    def weekly_frame(self, weeks=None, companies=None, functions=None) -> pd.DataFrame:
+        """One row per (week, direction) with its ``count``, like ``weekly_counts``."""
+        where, params = self._where(weeks, companies, functions)
+        wk = self.db.query(
+            f'SELECT week, direction AS "{DIRECTION}", COUNT(*) AS count FROM {self.name} '
+            f"WHERE {where} AND week IS NOT NULL AND direction IS NOT NULL "
+            "GROUP BY week, direction ORDER BY week, direction",
+            params,
+        )
+        wk["count"] = wk["count"].astype("int64")
+        wk["week"] = pd.to_datetime(wk["week"])
+        return wk
+
+
+class JobChangeWatcher:
+    """Poll ``data_dir`` for new drops and feed them to one tally.
+
+    ``loader(path)`` must return a frame with the raw columns plus ``week``,
+    or an iterator of such frames for a drop read in chunks; each chunk is
+    folded into the tally as it arrives.
+    Polls closer together than ``min_interval`` seconds do nothing, so it
+    is cheap to call from every page render. ``tally`` defaults to a new
+    ``JobChangeTally``.
+    """
+
+    def __init__(self, data_dir: Path, pattern: str, loader, min_interval: float = 30.0, tally=None):
+        self.data_dir = Path(data_dir)
+        self.pattern = pattern
+        self.loader = loader
+        self.min_interval = min_interval
+        self.tally = tally if tally is not None else JobChangeTally()
+        self.files = {}  # name -> (mtime_ns, size) when ingested
+        self.version = 0
+        self._last_poll = None
+        self._lock = threading.Lock()
+
+    def poll(self, force: bool = False) -> list[Path]:
+        """Ingest new or changed files; return the ones that added rows."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._last_poll is not None and now - self._last_poll < self.min_interval:
+                return []
+            self._last_poll = now
+            changed = []
+            stored = self.tally.ingested()  # by any process sharing the tally
+            for path in sorted(self.data_dir.glob(self.pattern)):
+                st = path.stat()
+                sig = (st.st_mtime_ns, st.st_size)
+                if self.files.get(path.name) == sig:
+                    continue
+                if stored.get(path.name) == sig:
+                    # already in the tally (an earlier run, or another worker)
+                    self.files[path.name] = sig
+                    changed.append(path)
+                    continue
+                # a rewritten file is read again; its old rows are deduped
+                loaded = self.loader(path)
+                chunks = [loaded] if isinstance(loaded, pd.DataFrame) else loaded
+                added = sum(self.tally.add(chunk) for chunk in chunks)
+                self.tally.mark_ingested(path.name, sig)
+                self.files[path.name] = sig
+                if added:
+                    changed.append(path)
+            if changed:
+                self.version += 1
+            return changed
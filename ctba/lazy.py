@@ -0,0 +1,67 @@
+# ctba/lazy.py
+"""Datasets and figures that are built on first use.
+
+``app.py`` imports every page under docs/, so anything a page computes at
+module level is paid for at boot by every worker, even for users who never
+open that page. Pages wrap such values in ``@lazy("name")`` and call
+``.get()`` from their layout function and callbacks instead.
+
+For ``gunicorn --preload`` (CTBA_PRELOAD=1, see gunicorn.conf.py) the
+master calls ``load_all()`` before forking so workers share the loaded
+frames copy-on-write rather than each building its own. Values that
+only one CTBA_BACKEND uses are registered with ``backend=`` and left out
+of ``load_all`` under the other.
+"""
+import threading
+
+from ctba.sqldb import BACKEND
+
+
+class Lazy:
+    def __init__(self, name: str, loader, backend: str = None):
+        self.name = name
+        self.loader = loader
+        self.backend = backend
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self.loader()
+                    self._loaded = True
+        return self._value
+
+    def reset(self) -> None:
+        """Drop the value so the next ``get()`` rebuilds it."""
+        with self._lock:
+            self._value = None
+            self._loaded = False
+
+
+registry: dict[str, Lazy] = {}
+
+
+def lazy(name: str, backend: str = None):
+    """Decorator: turn a zero-argument loader into a registered ``Lazy``.
+
+    ``backend`` ("pandas" or "sqlite") marks a value only that backend reads.
+    """
+    def decorator(loader):
+        registry[name] = Lazy(name, loader, backend)
+        return registry[name]
+    return decorator
+
+
+def load_all() -> list[str]:
+    """Build every value the active backend uses now (used before forking workers)."""
+    names = [name for name, item in registry.items() if item.backend in (None, BACKEND)]
+    for name in names:
+        registry[name].get()
+    return names
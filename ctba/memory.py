@@ -0,0 +1,77 @@
+# ctba/memory.py
+"""Per-worker memory accounting for the loaded datasets.
+
+``report()`` sizes every loaded ``ctba.lazy`` value plus anything passed to
+``track()`` (deep bytes: string payloads and categories included) and adds
+the process RSS. ``register_debug_routes`` serves it as JSON at
+``/debug/memory`` when CTBA_DEBUG=1. Each gunicorn worker answers with its
+own numbers (see ``pid``); multiply by the worker count to size an instance,
+except for ``store_mapped_bytes``: frames memory-mapped from ``ctba.store``
+are held once for all workers.
+"""
+import os
+import sys
+
+import pandas as pd
+from flask import jsonify
+
+from ctba import lazy
+from ctba.store import store
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - optional dependency
+    psutil = None
+
+DEBUG_ENABLED = os.environ.get("CTBA_DEBUG", "0") == "1"
+
+_tracked = {}
+
+
+def track(name: str, getter) -> None:
+    """Include ``getter()`` in the report under ``name``."""
+    _tracked[name] = getter
+
+
+def deep_bytes(obj) -> int:
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True, index=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if hasattr(obj, "memory_bytes"):
+        return int(obj.memory_bytes())
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(deep_bytes(k) + deep_bytes(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(deep_bytes(v) for v in obj)
+    if hasattr(obj, "to_plotly_json"):
+        return len(obj.to_json())  # serialized size is what a figure costs
+    return sys.getsizeof(obj)
+
+
+def rss_bytes():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def report() -> dict:
+    sizes = {name: deep_bytes(item.get()) for name, item in lazy.registry.items() if item.loaded}
+    sizes.update({name: deep_bytes(getter()) for name, getter in _tracked.items()})
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "datasets": sizes,
+        "datasets_total_bytes": sum(sizes.values()),
+        "store_mapped_bytes": store.mapped_bytes(),
+        "not_loaded": sorted(name for name, item in lazy.registry.items() if not item.loaded),
+    }
+
+
+def register_debug_routes(server) -> None:
+    if DEBUG_ENABLED:
+        server.add_url_rule("/debug/memory", "ctba_debug_memory", lambda: jsonify(report()))
@@ -0,0 +1,161 @@
+# ctba/metrics.py
+"""Prometheus metrics for callback latency and page views (CTBA_METRICS=1).
+
+Every Dash callback is timed per request and the time is split into
+phases on ``ctba_callback_seconds{callback, phase}``:
+
+* ``external_io`` — HTTP calls made through ``ctba.upstream`` sessions
+  (Open-Meteo, NASA) while the callback ran,
+* ``serialize`` — Dash encoding the return value as JSON,
+* ``compute`` — the rest: pandas, figure construction, cache lookups,
+* ``total`` — all of the above.
+
+Background callbacks run in a job process, so only their dispatch and
+polling requests are seen here. ``ctba_page_views_total{path}`` counts
+page renders (initial loads and in-app navigation) per page_registry
+path, and ``ctba_upstream_seconds{host}`` times every upstream call,
+including the background refreshes. ``ctba_upstream_rejected_total{host,
+reason}`` counts the calls failed fast by an open circuit breaker
+(``open``) or a host at its concurrency limit (``busy``).
+
+Served at ``/metrics`` in the Prometheus text format. Under gunicorn set
+PROMETHEUS_MULTIPROC_DIR (gunicorn.conf.py does) so that every worker's
+samples are aggregated, whichever worker answers the scrape.
+"""
+import contextlib
+import contextvars
+import functools
+import os
+import time
+
+import dash
+from flask import Response, request
+
+try:
+    import prometheus_client as prom
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover - optional dependency
+    prom = None
+
+ENABLED = os.environ.get("CTBA_METRICS", "0") == "1" and prom is not None
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+if ENABLED:
+    CALLBACK_SECONDS = prom.Histogram(
+        "ctba_callback_seconds", "Dash callback latency by phase", ["callback", "phase"], buckets=BUCKETS)
+    UPSTREAM_SECONDS = prom.Histogram(
+        "ctba_upstream_seconds", "Upstream HTTP call latency", ["host"], buckets=BUCKETS)
+    PAGE_VIEWS = prom.Counter("ctba_page_views", "Page renders per page_registry path", ["path"])
+    UPSTREAM_REJECTED = prom.Counter(
+        "ctba_upstream_rejected", "Upstream calls failed fast without being sent", ["host", "reason"])
+
+
+class _Timing:
+    __slots__ = ("io", "serialize")
+
+    def __init__(self):
+        self.io = 0.0
+        self.serialize = 0.0
+
+
+# the timing of the callback running in this request, if any
+_current = contextvars.ContextVar("ctba_callback_timing", default=None)
+
+
+@contextlib.contextmanager
+def external_io(host: str):
+    """Time an upstream call, and charge it to the running callback."""
+    if not ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        UPSTREAM_SECONDS.labels(host or "unknown").observe(elapsed)
+        timing = _current.get()
+        if timing is not None:
+            timing.io += elapsed
+
+
+def upstream_rejected(host: str, reason: str) -> None:
+    """Count a call that ``ctba.upstream`` failed fast (``reason``: open breaker or full host)."""
+    if ENABLED:
+        UPSTREAM_REJECTED.labels(host or "unknown", reason).inc()
+
+
+def _timed_to_json(to_json):
+    @functools.wraps(to_json)
+    def wrapper(obj):
+        timing = _current.get()
+        if timing is None:
+            return to_json(obj)
+        t0 = time.perf_counter()
+        try:
+            return to_json(obj)
+        finally:
+            timing.serialize += time.perf_counter() - t0
+    return wrapper
+
+
+def callback_name(func) -> str:
+    inner = getattr(func, "__wrapped__", func)
+    return f"{inner.__module__.rsplit('.', 1)[-1]}.{inner.__name__}"
+
+
+def _timed_callback(func):
+    name = callback_name(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        timing = _Timing()
+        token = _current.set(timing)
+        t0 = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            total = time.perf_counter() - t0
+            _current.reset(token)
+            CALLBACK_SECONDS.labels(name, "total").observe(total)
+            CALLBACK_SECONDS.labels(name, "external_io").observe(timing.io)
+            CALLBACK_SECONDS.labels(name, "serialize").observe(timing.serialize)
+            CALLBACK_SECONDS.labels(name, "compute").observe(max(total - timing.io - timing.serialize, 0.0))
+    wrapper.ctba_timed = True
+    return wrapper
+
+
+def _page_path(dash_app, pathname) -> str:
+    path = "/" + (dash_app.strip_relative_path(pathname) or "")
+    known = {page["path"] for page in dash.page_registry.values()}
+    return path if path in known else "other"  # bounded label set
+
+
+def install(dash_app) -> None:
+    if not ENABLED:
+        return
+    import dash._callback
+    dash._callback.to_json = _timed_to_json(dash._callback.to_json)
+
+    @dash_app.server.before_request
+    def instrument():
+        if not request.path.endswith("/_dash-update-component"):
+            return
+        # callbacks are merged into callback_map on the first request; wrap any new ones
+        for spec in dash_app.callback_map.values():
+            func = spec.get("callback")  # clientside callbacks have none
+            if func is not None and not getattr(func, "ctba_timed", False):
+                spec["callback"] = _timed_callback(func)
+        body = request.get_json(silent=True) or {}
+        for item in body.get("inputs", []):
+            if isinstance(item, dict) and item.get("id") == "_pages_location" and item.get("property") == "pathname":
+                PAGE_VIEWS.labels(_page_path(dash_app, item.get("value"))).inc()
+
+    @dash_app.server.route("/metrics")
+    def metrics():
+        registry = prom.REGISTRY
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = prom.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(prom.generate_latest(registry), content_type=prom.CONTENT_TYPE_LATEST)
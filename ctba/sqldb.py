@@ -0,0 +1,89 @@
+# ctba/sqldb.py
+"""Optional SQLite query backend for the page datasets.
+
+With CTBA_BACKEND=sqlite the pages don't hold their CSVs as pandas
+frames. ``db.table(name, chunks, key, indexes)`` ingests a dataset into
+one local database file (CTBA_SQL_DB) a chunk at a time, indexes it and
+records ``key`` (use ``source_key(path)``), so it is only ingested again
+when the source changes. Callbacks then read just the rows they need
+with indexed queries through ``db.query``. SQLite's file locking lets
+every gunicorn worker read, and the job-change watcher write, the same
+file.
+
+The default, CTBA_BACKEND=pandas, keeps the in-memory frames; both paths
+stay so ``bench.callbacks`` can compare them.
+"""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from ctba.datasets import CACHE_DIR
+from ctba.store import _FileLock
+
+BACKEND = os.environ.get("CTBA_BACKEND", "pandas")
+SQL = BACKEND == "sqlite"
+DB_PATH = Path(os.environ.get("CTBA_SQL_DB", CACHE_DIR / "ctba.sqlite"))
+CHUNK_ROWS = int(os.environ.get("CTBA_SQL_CHUNK_ROWS", 100_000))
+
+
+def csv_chunks(path: Path, chunksize: int = CHUNK_ROWS, **kwargs):
+    """``path`` read ``chunksize`` rows at a time, so ingesting never holds the whole file."""
+    for chunk in pd.read_csv(path, chunksize=chunksize, **kwargs):
+        chunk.columns = [c.strip() for c in chunk.columns]
+        yield chunk
+
+
+def placeholders(values) -> str:
+    return ", ".join("?" * len(values))
+
+
+class QueryDB:
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        self._local = threading.local()  # one connection per thread
+
+    def connect(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            con = sqlite3.connect(self.path, timeout=30)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("CREATE TABLE IF NOT EXISTS ctba_tables (name TEXT PRIMARY KEY, key TEXT)")
+            con.commit()
+            self._local.con = con
+        return con
+
+    def _key(self, con, name: str):
+        row = con.execute("SELECT key FROM ctba_tables WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def table(self, name: str, chunks, key: str = "", indexes=()) -> str:
+        """Ingest the frames from ``chunks()`` as table ``name`` unless it holds ``key`` already.
+
+        ``indexes`` lists column tuples to index. Returns ``name``.
+        """
+        con = self.connect()
+        if self._key(con, name) != key:
+            with _FileLock(self.path.parent / f".{self.path.name}.{name}.lock"):
+                if self._key(con, name) != key:  # another worker may have ingested it meanwhile
+                    staging = f"{name}__ingest"
+                    con.execute(f'DROP TABLE IF EXISTS "{staging}"')
+                    for chunk in chunks():
+                        chunk.to_sql(staging, con, if_exists="append", index=False)
+                    with con:  # swapped in one transaction: readers see the old table until it commits
+                        con.execute("BEGIN")
+                        con.execute(f'DROP TABLE IF EXISTS "{name}"')
+                        con.execute(f'ALTER TABLE "{staging}" RENAME TO "{name}"')
+                        for cols in indexes:
+                            con.execute(f'CREATE INDEX "{name}_{"_".join(cols)}" ON "{name}" ({", ".join(cols)})')
+                        con.execute("INSERT OR REPLACE INTO ctba_tables VALUES (?, ?)", (name, key))
+        return name
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        return pd.read_sql_query(sql, self.connect(), params=tuple(params))
+
+
+db = QueryDB()
@@ -0,0 +1,129 @@
+# ctba/staticfigs.py
+"""Build-time export of every figure variant as immutable static JSON.
+
+Pages with a finite input domain define ``static_key()`` (what their
+figures depend on: ``source_key(DATA_PATH)`` and a ``code_key`` of the
+code that builds them, so a deploy that changes it ignores the export) and
+``static_figures()`` yielding ``(figure, args, fig)`` for every input
+combination. ``python -m ctba.staticfigs`` imports the app, serializes
+each variant exactly as its callback would send it, and writes it under
+a content-hash name to ``CTBA_FIGURE_DIR`` with gzip/brotli copies next
+to it, plus ``manifest.json``:
+
+    {"pages": {"electricity": {"key": ..., "figures": {"map": {"[2005, \\"residential\\", \\"all\\"]": "<hash>.json"}}}}}
+
+``/figures/<hash>.json`` serves the files with a one-year immutable
+Cache-Control. A page calls ``urls(page, static_key())`` at import: when
+the manifest was built for the same key, its callbacks return the URL of
+the precomputed file and ``ctba.loadFigures`` (assets/clientside.js)
+fetches it, so no figure is built or serialized while serving.
+"""
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+from flask import abort, request, send_file
+from plotly.io.json import to_json_plotly
+
+from ctba.compression import ENCODINGS, encode
+from ctba.datasets import CACHE_DIR, _write_atomic
+
+ENABLED = os.environ.get("CTBA_STATIC_FIGURES", "1") == "1"
+FIGURE_DIR = Path(os.environ.get("CTBA_FIGURE_DIR", CACHE_DIR / "figures"))
+URL_PREFIX = "/figures/"
+MANIFEST = "manifest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def figure_key(*args) -> str:
+    return json.dumps(args)
+
+
+def load_manifest(figure_dir: Path = FIGURE_DIR) -> dict:
+    try:
+        return json.loads((Path(figure_dir) / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return {"pages": {}}
+
+
+manifest = load_manifest()
+
+
+def urls(page: str, key: str) -> dict:
+    """{figure: {figure_key(*args): url}} for ``page`` if exported for ``key``, else {}."""
+    entry = manifest["pages"].get(page)
+    if not ENABLED or not entry or entry["key"] != key:
+        return {}
+    return {fig: {k: URL_PREFIX + name for k, name in files.items()}
+            for fig, files in entry["figures"].items()}
+
+
+def _write_variant(payload: bytes, figure_dir: Path) -> str:
+    name = hashlib.sha256(payload).hexdigest()[:20] + ".json"
+    path = figure_dir / name
+    if not path.exists():
+        for encoding in ENCODINGS:
+            _write_atomic(path.with_name(f"{name}.{encoding}"), encode(payload, encoding, static=True))
+        _write_atomic(path, payload)
+    return name
+
+
+def export(pages: dict, figure_dir: Path = FIGURE_DIR) -> dict:
+    """Write every variant of ``pages`` ({page name: module}) and the manifest."""
+    figure_dir = Path(figure_dir)
+    figure_dir.mkdir(parents=True, exist_ok=True)
+    out = {"pages": {}}
+    for page, module in pages.items():
+        figures = {}
+        for fig, args, value in module.static_figures():
+            name = _write_variant(to_json_plotly(value).encode(), figure_dir)
+            figures.setdefault(fig, {})[figure_key(*args)] = name
+        out["pages"][page] = {"key": module.static_key(), "figures": figures}
+    _write_atomic(figure_dir / MANIFEST, json.dumps(out, indent=1).encode())
+
+    # files from earlier exports that nothing points at any more
+    keep = {name for entry in out["pages"].values() for files in entry["figures"].values()
+            for name in files.values()}
+    for path in figure_dir.glob("*.json*"):
+        if path.name != MANIFEST and path.name.split(".json")[0] + ".json" not in keep:
+            path.unlink()
+    return out
+
+
+def register_routes(server) -> None:
+    @server.route(URL_PREFIX + "<name>")
+    def static_figure(name):
+        if "/" in name or not name.endswith(".json") or name == MANIFEST:
+            abort(404)
+        path = FIGURE_DIR / name
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        variant = path.with_name(f"{name}.{encoding}") if encoding else None
+        if variant is not None and variant.exists():
+            response = send_file(variant, mimetype="application/json", conditional=False)
+            response.headers["Content-Encoding"] = encoding
+        elif path.exists():
+            response = send_file(path, mimetype="application/json", conditional=False)
+        else:
+            abort(404)
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault("CTBA_WEATHER_PREFETCH", "0")
+    import dash
+    import app  # noqa: F401  registers the pages
+
+    pages = {}
+    for page in dash.page_registry.values():
+        module = sys.modules[page["module"]]
+        if hasattr(module, "static_figures"):
+            pages[module.__name__.rsplit(".", 1)[-1]] = module
+    result = export(pages)
+    for page, entry in result["pages"].items():
+        print(f"{page}: {sum(len(f) for f in entry['figures'].values())} figures")
+    print(f"wrote {FIGURE_DIR / MANIFEST}")
@@ -0,0 +1,150 @@
+# ctba/store.py
+"""Read-only DataFrames shared by every worker through memory-mapped Arrow files.
+
+``store.frame(name, build, key)`` returns the frame saved under ``name``
+in ``CACHE_DIR/store``, calling ``build()`` and saving its result first
+when the file is missing or was written for a different ``key`` (use
+``frame_key(path, *builders)`` to tie it to a source file and the code
+that turns it into the frame). The first worker to get
+there builds it under a file lock; every worker then memory-maps the same
+file and converts it to pandas without copying: numeric columns and
+categorical codes are read-only views of the mapping and strings stay
+Arrow buffers. The pages are shared by all workers through the OS page
+cache, so adding workers doesn't add a copy of each dataset.
+
+Frames from the store are read-only; pandas copies a column the first
+time it is modified. Without pyarrow (or with CTBA_STORE=0), ``frame``
+just returns ``build()``.
+"""
+import hashlib
+import inspect
+import json
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from ctba.datasets import CACHE_DIR, dtype_policy
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+ENABLED = os.environ.get("CTBA_STORE", "1") == "1" and pa is not None
+STORE_DIR = CACHE_DIR / "store"
+KEY_FIELD = b"ctba.key"
+
+
+def source_key(*paths) -> str:
+    """Identifies the current contents of the source files (mtime and size)."""
+    parts = []
+    for p in paths:
+        st = Path(p).stat()
+        parts.append(f"{Path(p).name}:{st.st_mtime_ns}:{st.st_size}")
+    return "|".join(parts)
+
+
+def code_key(*objs, extra: str = "") -> str:
+    """A short hash of the source of ``objs`` and ``extra``.
+
+    ``objs`` are functions, classes, modules or source file paths (a page
+    hashes its own ``__file__``: Dash registers the module only after
+    running it).
+    """
+    code = hashlib.sha256(extra.encode())
+    for obj in objs:
+        code.update(Path(obj).read_bytes() if isinstance(obj, (str, Path)) else inspect.getsource(obj).encode())
+    return code.hexdigest()[:16]
+
+
+def frame_key(path, *builders) -> str:
+    """``source_key(path)`` plus a hash of how the frame is built from it.
+
+    The hash covers the file's ``DTYPE_POLICY`` entry and the source of
+    ``builders`` (the functions that read and reshape it), so editing any
+    of them rebuilds the stored frame on the next start.
+    """
+    policy = json.dumps(dtype_policy(path), sort_keys=True)
+    return f"{source_key(path)}|code:{code_key(*builders, extra=policy)}"
+
+
+class _FileLock:
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = open(self.path, "w")
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+
+
+class DatasetStore:
+    def __init__(self, root: Path = STORE_DIR):
+        self.root = Path(root)
+        self._tables = {}  # name -> memory-mapped pa.Table, kept alive with the frames
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _path(self, name: str) -> Path:
+        return self.root / f"{name}.arrow"
+
+    def _open(self, name: str, key: str):
+        """The mapped table for ``name`` if it was saved for ``key``, else None."""
+        path = self._path(name)
+        try:
+            table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+        except (OSError, pa.ArrowException):
+            return None
+        if (table.schema.metadata or {}).get(KEY_FIELD) != key.encode():
+            return None
+        return table
+
+    def _save(self, name: str, df: pd.DataFrame, key: str) -> None:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), KEY_FIELD: key.encode()})
+        path = self._path(name)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+
+    def frame(self, name: str, build, key: str = "") -> pd.DataFrame:
+        if not ENABLED:
+            return build()
+        with self._guard:
+            lock = self._locks.setdefault(name, threading.Lock())
+        with lock:  # per name: a build may read another store frame
+            table = self._open(name, key)
+            if table is None:
+                try:
+                    with _FileLock(self.root / f".{name}.lock"):
+                        table = self._open(name, key)  # another worker may have built it meanwhile
+                        if table is None:
+                            self._save(name, build(), key)
+                            table = self._open(name, key)
+                except (OSError, pa.ArrowException) as e:
+                    print(f"Dataset store unavailable for {name}: {e}")
+                    return build()
+            self._tables[name] = table
+        return table.to_pandas(split_blocks=True)
+
+    def mapped_bytes(self) -> int:
+        """Bytes of this process's frames that live in shared mappings."""
+        return sum(t.nbytes for t in self._tables.values())
+
+
+store = DatasetStore()
@@ -0,0 +1,502 @@
+# ctba/upstream.py
+"""Helpers for pages that call external HTTP APIs.
+
+``TTLCache`` keeps one value per key for ``ttl`` seconds and coalesces
+concurrent misses, so N users asking for the same key at once cause one
+upstream call (single-flight). After ``ttl`` an entry may still be served
+for ``stale_ttl`` seconds while a single background refresh replaces it
+(stale-while-revalidate).
+
+When a fetch fails and the key has an older value, ``get`` returns that
+instead (last-known-good), however old it is.
+
+``Refresher`` keeps a known set of keys warm from a background thread,
+and ``make_session`` builds the pooled, retrying ``requests.Session``
+shared by those fetches; its calls are timed by ``ctba.metrics``.
+
+Every session call goes through its host's ``HostGuard``, which is
+shared by all sessions in the process. The guard allows at most
+CTBA_UPSTREAM_CONCURRENCY calls in flight to the host from the process.
+It also holds a ``CircuitBreaker``: after CTBA_BREAKER_FAILURES failures
+in a row (a connection error, a timeout, a 429 or a 5xx), calls raise
+``UpstreamUnavailable`` at once instead of waiting out their timeouts.
+After CTBA_BREAKER_RESET seconds, or a 429's Retry-After, one probe call
+is let through. If the probe succeeds the breaker closes; if it fails
+the breaker opens again. Breaker state is kept in CTBA_BREAKER_DB, so
+every gunicorn worker shares it.
+"""
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RetryError
+from urllib3.util.retry import Retry
+
+from ctba.datasets import CACHE_DIR
+from ctba.metrics import external_io, upstream_rejected
+
+BREAKER_FAILURES = int(os.environ.get("CTBA_BREAKER_FAILURES", 3))
+BREAKER_RESET = float(os.environ.get("CTBA_BREAKER_RESET", 30))
+HOST_CONCURRENCY = int(os.environ.get("CTBA_UPSTREAM_CONCURRENCY", 4))
+HOST_QUEUE_WAIT = float(os.environ.get("CTBA_UPSTREAM_QUEUE_WAIT", 2))
+# shared by every process on the instance; empty keeps the breakers per process
+BREAKER_DB = os.environ.get("CTBA_BREAKER_DB", str(CACHE_DIR / "breakers.sqlite"))
+# responses that count against a host's breaker, like the errors make_session retries
+FAILURE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+
+class TTLCache:
+    def __init__(self, ttl: float, stale_ttl: float = 0.0, fallback: bool = True, clock=time.monotonic):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.fallback = fallback
+        self.clock = clock
+        self._entries = {}   # key -> (value, fetched_at)
+        self._inflight = {}  # key -> Future shared by every waiter
+        self._lock = threading.Lock()
+        self.hits = self.stale_hits = self.misses = self.coalesced = self.fallbacks = 0
+
+    def _start(self, key):
+        """Return (future, is_leader) for a fetch of ``key``; lock must be held."""
+        fut = self._inflight.get(key)
+        if fut is not None:
+            return fut, False
+        fut = Future()
+        self._inflight[key] = fut
+        return fut, True
+
+    def _run(self, key, fut, fetch):
+        try:
+            value = fetch()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            fut.set_exception(e)
+            return
+        with self._lock:
+            self._entries[key] = (value, self.clock())
+            self._inflight.pop(key, None)
+        fut.set_result(value)
+
+    def get(self, key, fetch):
+        """Return the cached value for ``key``, calling ``fetch()`` when needed."""
+        with self._lock:
+            entry = self._entries.get(key)
+            age = None if entry is None else self.clock() - entry[1]
+            if age is not None and age < self.ttl:
+                self.hits += 1
+                return entry[0]
+            fut, leader = self._start(key)
+            if age is not None and age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                if leader:
+                    threading.Thread(target=self._run, args=(key, fut, fetch), daemon=True).start()
+                return entry[0]
+            if leader:
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            self._run(key, fut, fetch)
+        try:
+            return fut.result()
+        except Exception:
+            if entry is None or not self.fallback:
+                raise
+            with self._lock:
+                self.fallbacks += 1
+            return entry[0]  # last known good
+
+    def peek(self, key):
+        """Return the cached value (fresh or not) without fetching, else None."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else entry[0]
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._entries[key] = (value, self.clock())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "fallbacks": self.fallbacks,
+            }
+
+
+class UpstreamUnavailable(requests.RequestException):
+    """Raised without calling the host: its breaker is open or it has too many calls in flight."""
+
+
+class MemoryBoard:
+    """Breaker state for this process only."""
+
+    def __init__(self):
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def read(self, host: str) -> dict:
+        with self._lock:
+            return dict(self._rows.get(host, CLOSED))
+
+    @contextlib.contextmanager
+    def update(self, host: str):
+        """Yield the host's row to change in place; saved atomically."""
+        with self._lock:
+            row = dict(self._rows.get(host, CLOSED))
+            yield row
+            self._rows[host] = row
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+
+
+class SQLiteBoard:
+    """Breaker state in a SQLite file shared by every process on the instance.
+
+    gunicorn workers (and background job processes) see one breaker per
+    host, so an outage costs CTBA_BREAKER_FAILURES slow calls in all, not
+    that many per process.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()  # one connection per thread, per process
+        self._connect()  # fail here, not mid-request, if the file can't be opened
+
+    def _connect(self) -> sqlite3.Connection:
+        if getattr(self._local, "pid", None) != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            con = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("CREATE TABLE IF NOT EXISTS breakers (host TEXT PRIMARY KEY, errors INTEGER, open_until REAL)")
+            self._local.con, self._local.pid = con, os.getpid()
+        return self._local.con
+
+    def _row(self, con, host: str) -> dict:
+        row = con.execute("SELECT errors, open_until FROM breakers WHERE host = ?", (host,)).fetchone()
+        return dict(CLOSED) if row is None else {"errors": row[0], "open_until": row[1]}
+
+    def read(self, host: str) -> dict:
+        return self._row(self._connect(), host)
+
+    @contextlib.contextmanager
+    def update(self, host: str):
+        con = self._connect()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._row(con, host)
+            yield row
+            con.execute("INSERT OR REPLACE INTO breakers VALUES (?, ?, ?)", (host, row["errors"], row["open_until"]))
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        con.execute("COMMIT")
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM breakers")
+
+
+CLOSED = {"errors": 0, "open_until": None}
+
+
+def open_board():
+    """The shared SQLiteBoard, or a MemoryBoard if CTBA_BREAKER_DB is empty or unusable."""
+    if not BREAKER_DB:
+        return MemoryBoard()
+    try:
+        return SQLiteBoard(Path(BREAKER_DB))
+    except (OSError, sqlite3.Error) as e:
+        # read-only checkout: every process keeps its own breakers
+        print(f"Could not open {BREAKER_DB}, upstream breakers are per process: {e}")
+        return MemoryBoard()
+
+
+class CircuitBreaker:
+    """closed -> open after ``failures`` failures in a row -> half-open after ``reset`` seconds.
+
+    While open every call is refused; half-open lets a single probe through,
+    which pushes the reopening back by ``reset`` so that no other call
+    follows it until it is answered (or lost). ``failures=0`` disables it.
+    State lives on ``board``; the clock is wall time so processes agree.
+    """
+
+    def __init__(self, host: str, failures: int = BREAKER_FAILURES, reset: float = BREAKER_RESET,
+                 board=None, clock=time.time):
+        self.host = host
+        self.failures = failures
+        self.reset = reset
+        self.board = MemoryBoard() if board is None else board
+        self.clock = clock
+        self._probe = threading.local()  # set on the thread sending the probe
+        self.opened = self.rejected = 0  # this process's share
+
+    @property
+    def state(self) -> str:
+        open_until = self.board.read(self.host)["open_until"]
+        if open_until is None:
+            return "closed"
+        return "half-open" if self.clock() >= open_until else "open"
+
+    def retry_in(self) -> float:
+        """Seconds until the next probe may go out (0 when closed)."""
+        open_until = self.board.read(self.host)["open_until"]
+        return 0.0 if open_until is None else max(open_until - self.clock(), 0.0)
+
+    def allow(self) -> bool:
+        self._probe.active = False
+        if not self.failures or self.board.read(self.host)["open_until"] is None:
+            return True  # the common case: one read, no write
+        with self.board.update(self.host) as row:
+            now = self.clock()
+            if row["open_until"] is None:
+                return True
+            if now >= row["open_until"]:
+                row["open_until"] = now + self.reset
+                self._probe.active = True
+                return True
+        self.rejected += 1
+        return False
+
+    def success(self) -> None:
+        self._probe.active = False
+        if self.board.read(self.host) != CLOSED:
+            with self.board.update(self.host) as row:
+                row.update(CLOSED)
+
+    def failure(self, retry_after: float = None) -> None:
+        """Record a failed call; ``retry_after`` (a 429's) opens the breaker at once, for at least that long."""
+        self._probe.active = False
+        if not self.failures:
+            return
+        with self.board.update(self.host) as row:
+            row["errors"] += 1
+            was_open = row["open_until"] is not None
+            if was_open or retry_after is not None or row["errors"] >= self.failures:
+                if not was_open:
+                    self.opened += 1
+                row["open_until"] = self.clock() + max(self.reset, retry_after or 0.0)
+
+    def abandon(self) -> None:
+        """The call was never sent or answered for reasons of our own; a probe lets the next one go."""
+        if getattr(self._probe, "active", False):
+            self._probe.active = False
+            with self.board.update(self.host) as row:
+                if row["open_until"] is not None:
+                    row["open_until"] = self.clock()
+
+
+def retry_after(response) -> float:
+    """Seconds a 429 asks us to wait (0 when it doesn't say in seconds); None for other statuses."""
+    if response.status_code != 429:
+        return None
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return 0.0
+
+
+class HostGuard:
+    """The breaker and this process's in-flight limit for one upstream host."""
+
+    def __init__(self, host: str, concurrency: int, queue_wait: float, breaker: CircuitBreaker):
+        self.host = host
+        self.breaker = breaker
+        self.queue_wait = queue_wait
+        self._slots = threading.BoundedSemaphore(concurrency)
+
+    def call(self, send):
+        """Return ``send()``'s response, or raise ``UpstreamUnavailable`` without calling it."""
+        if not self.breaker.allow():
+            upstream_rejected(self.host, "open")
+            raise UpstreamUnavailable(
+                f"{self.host} is failing; not called again for {self.breaker.retry_in():.0f}s")
+        if not self._slots.acquire(timeout=self.queue_wait):
+            self.breaker.abandon()
+            upstream_rejected(self.host, "busy")
+            raise UpstreamUnavailable(f"{self.host} has too many calls in flight")
+        try:
+            response = send()
+        except (requests.ConnectionError, requests.Timeout, RetryError):
+            self.breaker.failure()
+            raise
+        except BaseException:
+            self.breaker.abandon()
+            raise
+        finally:
+            self._slots.release()
+        if response.status_code in FAILURE_STATUS:
+            self.breaker.failure(retry_after(response))
+        else:
+            self.breaker.success()
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "opened": self.breaker.opened,
+            "rejected": self.breaker.rejected,
+        }
+
+
+guards = {}  # host -> HostGuard, for every session in the process
+board = None  # opened on the first upstream call
+_guards_lock = threading.Lock()
+
+
+def host_guard(host: str) -> HostGuard:
+    global board
+    with _guards_lock:
+        guard = guards.get(host)
+        if guard is None:
+            if board is None:
+                board = open_board()
+            guard = guards[host] = HostGuard(
+                host, HOST_CONCURRENCY, HOST_QUEUE_WAIT,
+                CircuitBreaker(host, BREAKER_FAILURES, BREAKER_RESET, board))
+        return guard
+
+
+class TimedSession(requests.Session):
+    """A session whose connection pools belong to one process.
+
+    Pages build their sessions at import, which under ``gunicorn --preload``
+    is in the master. The first call in a forked worker mounts fresh
+    adapters (from ``new_adapter``) rather than reuse the keep-alive
+    sockets the parent may hold, like ``SQLiteBoard._connect`` does.
+    """
+
+    def __init__(self, new_adapter):
+        super().__init__()
+        self._new_adapter = new_adapter
+        self._pid = None
+        self._pid_lock = threading.Lock()
+        self._mount()
+
+    def _mount(self) -> None:
+        adapter = self._new_adapter()
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+        self._pid = os.getpid()
+
+    def request(self, method, url, *args, **kwargs):
+        if self._pid != os.getpid():
+            with self._pid_lock:
+                if self._pid != os.getpid():
+                    self._mount()
+        host = urlsplit(url).hostname
+
+        def send():
+            with external_io(host):
+                return super(TimedSession, self).request(method, url, *args, **kwargs)
+
+        return host_guard(host).call(send)
+
+
+def make_session(pool_size: int = 10, retries: int = 2, backoff: float = 0.5) -> requests.Session:
+    """A keep-alive session that retries GETs on connection errors and 429/5xx.
+
+    Retries back off by ``backoff`` seconds, doubling, whatever the
+    response's Retry-After says: a rate limit can ask for minutes, and a
+    callback thread shouldn't sleep through them. Once the retries run out
+    the last response is returned (callers ``raise_for_status``), so the
+    host's breaker sees its status and keeps the host closed for its
+    Retry-After instead.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    return TimedSession(lambda: HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry))
+
+
+class Refresher:
+    """Periodically run ``fetchers[key]()`` for every key into ``cache``.
+
+    The thread belongs to the process that called ``start()``. Pages
+    don't start it at import, which under ``gunicorn --preload`` is in the
+    master: they ``schedule()`` it, and ``start_refreshers()`` starts it
+    in each serving process (gunicorn.conf.py's ``post_fork``, and app.py
+    before a process's first request).
+    """
+
+    def __init__(self, cache: TTLCache, fetchers: dict, interval: float, max_workers: int = 8):
+        self.cache = cache
+        self.fetchers = fetchers
+        self.interval = interval
+        self.max_workers = max_workers
+        self.errors = {}
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def refresh_all(self) -> None:
+        def run(item):
+            key, fetch = item
+            try:
+                self.cache.put(key, fetch())
+                self.errors.pop(key, None)
+            except Exception as e:
+                # keep the previous value; the next round tries again
+                self.errors[key] = repr(e)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            list(pool.map(run, self.fetchers.items()))
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.refresh_all()
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            threading.Thread(target=self._loop, name="ctba-refresher", daemon=True).start()
+
+    def schedule(self) -> None:
+        """Have ``start_refreshers()`` start this refresher in every serving process."""
+        if self not in refreshers:
+            refreshers.append(self)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+refreshers = []  # every scheduled Refresher
+_started_pid = None
+
+
+def start_refreshers() -> None:
+    """Start the scheduled refreshers in this process, once per pid."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    _started_pid = os.getpid()
+    for refresher in refreshers:
+        if not refresher._stop.is_set():
+            refresher.start()
@@ -1,16 +1,33 @@
 import dash
-from dash import Dash, html, dcc
+from dash import Dash, html, dcc, Input, Output, callback, clientside_callback, ClientsideFunction
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import os
 from pathlib import Path
 
+from ctba import jobchanges
+from ctba.datasets import read_csv_cached, read_csv_chunks
+from ctba.jobchanges import (
+    COMPANY, FUNCTION, USECOLS, JobChangeWatcher, SQLJobChangeTally, departure_counts, parse_utc, week_start,
+    weekly_counts,
+)
+from ctba.lazy import lazy
+from ctba.memory import track
+from ctba.sqldb import SQL, db
+from ctba.staticfigs import figure_key, urls
+from ctba.store import code_key
+
 app = Dash(__name__)
 server = app.server
 
 dash.register_page(__name__, path="/JobChanges", name="Live Job Changes", order=4)
 
-DATA_PATH = Path(__file__).resolve().parent.parent / "data" / "livedata-weekly-job-changes-2025-07-23.csv"
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+DATA_PATTERN = "livedata-weekly-job-changes-*.csv"
+# Drops larger than this are streamed into the tallies, CHUNK_BYTES of CSV at a time
+STREAM_BYTES = int(os.environ.get("CTBA_JOBS_STREAM_BYTES", 256 * 2**20))
+CHUNK_BYTES = int(os.environ.get("CTBA_JOBS_CHUNK_BYTES", 32 * 2**20))
 
 def load_data(path: Path) -> pd.DataFrame:
     print(f"Loading data from: {path}  Exists: {path.exists()}")
@@ -24,42 +41,64 @@ def load_data(path: Path) -> pd.DataFrame:
         ]
         return pd.DataFrame(columns=cols)
 
-    df = pd.read_csv(path)
-    expected = {
-        "arrival/departure": "arrival/departure",
-        "previous_job.company.name": "previous_job.company.name",
-        "previous_job.function": "previous_job.function",
-        "current_job.started_at": "current_job.started_at",
-        "previous_job.ended_at": "previous_job.ended_at",
-    }
-    missing = [c for c in expected if c not in df.columns]
+    # Only read the columns we use (the export has 23), with the multithreaded
+    # Arrow parser, which also reads the ISO-8601 timestamps natively
+    header = pd.read_csv(path, nrows=0).columns
+    return prepare(read_csv_cached(path, usecols=[c for c in USECOLS if c in header], engine="pyarrow"))
+
+def prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """Fill in missing columns, parse the timestamps and add the ``week`` bucket."""
+    missing = [c for c in USECOLS if c not in df.columns]
     for c in missing:
         df[c] = pd.NA
 
     # Parse as UTC (tz-aware)
-    df["current_job.started_at"] = pd.to_datetime(
-        df["current_job.started_at"], errors="coerce", utc=True
-    )
-    df["previous_job.ended_at"] = pd.to_datetime(
-        df["previous_job.ended_at"], errors="coerce", utc=True
-    )
+    df["current_job.started_at"] = parse_utc(df["current_job.started_at"])
+    df["previous_job.ended_at"] = parse_utc(df["previous_job.ended_at"])
 
     # Arrivals use started_at; departures use ended_at
     arrival_mask = df["arrival/departure"].eq("arrival")
     event_time = df["current_job.started_at"].where(arrival_mask, df["previous_job.ended_at"])
 
-    # Drop tz before converting to weekly period start
-    event_time_naive = event_time.dt.tz_localize(None)
-    df["week"] = event_time_naive.dt.to_period("W").dt.start_time
+    # Monday-start week buckets, computed on integer day numbers
+    df["week"] = week_start(event_time)
 
     return df
 
-df = load_data(DATA_PATH)
+def stream_data(path: Path, chunk_bytes: int = CHUNK_BYTES):
+    """``load_data`` in frames of about ``chunk_bytes`` of CSV, so peak memory doesn't grow with the file."""
+    print(f"Streaming data from: {path}")
+    for chunk in read_csv_chunks(path, usecols=USECOLS, chunk_bytes=chunk_bytes):
+        yield prepare(chunk)
+
+def read_drop(path: Path):
+    """The watcher's loader: large drops are streamed, the rest read whole (and Arrow-cached)."""
+    if path.exists() and path.stat().st_size > STREAM_BYTES:
+        return stream_data(path)
+    return load_data(path)
+
+# New weekly drops in data/ are folded in as they appear, without a restart
+watcher = JobChangeWatcher(
+    DATA_DIR, DATA_PATTERN, loader=read_drop,
+    min_interval=float(os.environ.get("CTBA_JOBS_POLL", 30)),
+    tally=SQLJobChangeTally(db) if SQL else None,
+)
+track("jobchanges.tally", lambda: watcher.tally)
 
 # ---------- Figure builders ----------
+# The bar_/line_ builders take pre-counted data so they can be fed from the
+# watcher's running tallies; the fig_ wrappers count a raw frame first.
 def fig_top_departure_companies(data: pd.DataFrame, top_n: int = 5):
-    deps = data[data["arrival/departure"] == "departure"]
-    vc = deps["previous_job.company.name"].dropna().value_counts().nlargest(top_n)
+    return bar_top_companies(departure_counts(data, COMPANY), top_n)
+
+def fig_top_departure_functions(data: pd.DataFrame, top_n: int = 5):
+    return bar_top_functions(departure_counts(data, FUNCTION), top_n)
+
+def fig_weekly_arrivals_vs_departures(data: pd.DataFrame):
+    return line_weekly(weekly_counts(data))
+
+def bar_top_companies(counts: pd.Series, top_n: int = 5):
+    vc = counts.sort_index().nlargest(top_n)
     plot_df = vc.rename_axis("Company").reset_index(name="Departures").sort_values("Departures")
     if plot_df.empty:
         return go.Figure().update_layout(
@@ -77,9 +116,8 @@ def fig_top_departure_companies(data: pd.DataFrame, top_n: int = 5):
     )
     return fig
 
-def fig_top_departure_functions(data: pd.DataFrame, top_n: int = 5):
-    deps = data[data["arrival/departure"] == "departure"]
-    vc = deps["previous_job.function"].dropna().value_counts().nlargest(top_n)
+def bar_top_functions(counts: pd.Series, top_n: int = 5):
+    vc = counts.sort_index().nlargest(top_n)
     plot_df = vc.rename_axis("Job Function").reset_index(name="Departures").sort_values("Departures")
     if plot_df.empty:
         return go.Figure().update_layout(
@@ -97,16 +135,15 @@ def fig_top_departure_functions(data: pd.DataFrame, top_n: int = 5):
     )
     return fig
 
-def fig_weekly_arrivals_vs_departures(data: pd.DataFrame):
-    data_2025 = data[data["week"].dt.year == 2025]
-    if data_2025.empty:
+def line_weekly(wk: pd.DataFrame):
+    wk = wk[wk["week"].dt.year == 2025]
+    if wk.empty:
         return go.Figure().update_layout(
             title="Weekly Job Arrivals vs. Departures (2025)",
             xaxis_title="Week",
             yaxis_title="Count",
             annotations=[dict(text="No data available for 2025", x=0.5, y=0.5, xref="paper", yref="paper", showarrow=False)],
         )
-    wk = data_2025.groupby(["week", "arrival/departure"]).size().reset_index(name="count")
     pivot = wk.pivot(index="week", columns="arrival/departure", values="count").fillna(0).sort_index()
     tidy = pivot.reset_index().melt(id_vars=["week"], value_vars=list(pivot.columns), var_name="Type", value_name="Count")
     fig = px.line(tidy, x="week", y="Count", color="Type")
@@ -118,44 +155,146 @@ def fig_weekly_arrivals_vs_departures(data: pd.DataFrame):
     )
     return fig
 
-# ---------- Precompute STATIC figures ----------
-fig_companies = fig_top_departure_companies(df, top_n=5)
-fig_functions = fig_top_departure_functions(df, top_n=5)
-fig_weekly = fig_weekly_arrivals_vs_departures(df)
-
-# ---------- Static layout (no callbacks) ----------
-layout = html.Div(
-    style={"padding": "20px", "maxWidth": "1100px", "margin": "0 auto"},
-    children=[
-        html.H1("Job Changes Dashboard", style={"textAlign": "center"}),
-
-        html.Div(
-            [html.Label("Data file"), html.Div(str(DATA_PATH), style={"opacity": 0.7})],
-            style={"marginBottom": "16px"},
-        ),
-
-        html.P(
-            "This chart shows the top companies with the highest number of departures. "
-            "It helps you identify which organizations are experiencing the most exits."
-        ),
-        dcc.Graph(id="companies-bar", figure=fig_companies),
-
-        html.P(
-            "This chart shows the top job functions with the highest number of departures. "
-            "It helps highlight which roles or departments are most affected."
-        ),
-        dcc.Graph(id="functions-bar", figure=fig_functions),
-
-        html.P(
-            "This static chart compares weekly job arrivals and departures for the year 2025. "
-            "It provides a time-series view of workforce movement to spot trends, spikes, or declines."
-        ),
-        dcc.Graph(id="weekly-line", figure=fig_weekly),
-
-        html.Div(
-            "Data file not found — showing empty charts. Check the path: " + str(DATA_PATH)
-            if df.empty else "",
-            style={"marginTop": "8px", "color": "#8a6d3b"},
-        ),
-    ],
+# ---------- STATIC figures, built on the first visit ----------
+@lazy("jobchanges.figures")
+def figures():
+    watcher.poll()
+    tally = watcher.tally
+    return {
+        "companies": bar_top_companies(tally.company_counts(), top_n=5),
+        "functions": bar_top_functions(tally.function_counts(), top_n=5),
+        "weekly": line_weekly(tally.weekly_frame()),
+    }
+
+def current_figures():
+    """Figures for the latest tallies; rebuilt only when a new drop arrived."""
+    if watcher.poll():
+        figures.reset()
+    return figures.get()
+
+# the charts' code (and the tallies'): an export from an older version doesn't match
+FIGURE_CODE = code_key(Path(__file__), jobchanges)
+
+def static_key():
+    """The ingested drops, in ``source_key`` form, and the charts' code."""
+    drops = "|".join(f"{name}:{mtime}:{size}" for name, (mtime, size) in sorted(watcher.files.items()))
+    return f"{drops}|code:{FIGURE_CODE}"
+
+def static_figures():
+    """The unfiltered charts for the current drops (see ctba.staticfigs)."""
+    for name, fig in current_figures().items():
+        yield name, (), fig
+
+def week_range(tally, start_date, end_date):
+    """(start, end) timestamps for the picker, or None when it spans every week."""
+    lo, hi = tally.week_bounds()
+    if lo is None:
+        return None
+    start = pd.Timestamp(start_date) if start_date else lo
+    end = pd.Timestamp(end_date) if end_date else hi
+    if start <= lo and end >= hi:
+        return None  # also keeps rows whose event date is unknown
+    return start, end
+
+# ---------- Layout ----------
+def layout(**kwargs):
+    if watcher.poll():
+        figures.reset()
+    # precomputed charts when they were exported for exactly these drops
+    static = urls("BasicViz", static_key())
+    src = [static[name][figure_key()] for name in ("companies", "functions", "weekly")] if static else None
+    figs = {} if static else figures.get()
+
+    def graph(graph_id, name):
+        return dcc.Graph(id=graph_id) if static else dcc.Graph(id=graph_id, figure=figs[name])
+
+    tally = watcher.tally
+    first, last = tally.week_bounds()
+    companies = tally.companies()
+    functions = tally.functions()
+    return html.Div(
+        style={"padding": "20px", "maxWidth": "1100px", "margin": "0 auto"},
+        children=[
+            html.H1("Job Changes Dashboard", style={"textAlign": "center"}),
+
+            html.Div(
+                [html.Label("Data files"),
+                 html.Div(", ".join(sorted(watcher.files)) or str(DATA_DIR / DATA_PATTERN), style={"opacity": 0.7})],
+                style={"marginBottom": "16px"},
+            ),
+
+            html.Div(
+                style={"display": "flex", "gap": "12px", "flexWrap": "wrap", "marginBottom": "16px"},
+                children=[
+                    dcc.DatePickerRange(
+                        id="jobs-weeks",
+                        min_date_allowed=first,
+                        max_date_allowed=last,
+                        start_date=first,
+                        end_date=last,
+                        display_format="YYYY-MM-DD",
+                    ),
+                    dcc.Dropdown(id="jobs-companies", options=companies, multi=True,
+                                 placeholder="All companies", style={"flex": 1, "minWidth": "240px"}),
+                    dcc.Dropdown(id="jobs-functions", options=functions, multi=True,
+                                 placeholder="All job functions", style={"flex": 1, "minWidth": "240px"}),
+                ],
+            ),
+
+            html.P(
+                "This chart shows the top companies with the highest number of departures. "
+                "It helps you identify which organizations are experiencing the most exits."
+            ),
+            graph("companies-bar", "companies"),
+
+            html.P(
+                "This chart shows the top job functions with the highest number of departures. "
+                "It helps highlight which roles or departments are most affected."
+            ),
+            graph("functions-bar", "functions"),
+
+            html.P(
+                "This chart compares weekly job arrivals and departures for the year 2025. "
+                "It provides a time-series view of workforce movement to spot trends, spikes, or declines."
+            ),
+            graph("weekly-line", "weekly"),
+
+            html.Div(
+                "Data file not found — showing empty charts. Check the path: " + str(DATA_DIR / DATA_PATTERN)
+                if watcher.tally.rows == 0 else "",
+                style={"marginTop": "8px", "color": "#8a6d3b"},
+            ),
+            dcc.Store(id="jobs-figure-src", data=src),
+        ],
+    )
+
+
+clientside_callback(
+    ClientsideFunction(namespace="ctba", function_name="loadFigures"),
+    Output("companies-bar", "figure"),
+    Output("functions-bar", "figure"),
+    Output("weekly-line", "figure"),
+    Input("jobs-figure-src", "data"),
 )
+
+
+@callback(
+    Output("companies-bar", "figure", allow_duplicate=True),
+    Output("functions-bar", "figure", allow_duplicate=True),
+    Output("weekly-line", "figure", allow_duplicate=True),
+    Input("jobs-weeks", "start_date"),
+    Input("jobs-weeks", "end_date"),
+    Input("jobs-companies", "value"),
+    Input("jobs-functions", "value"),
+    prevent_initial_call=True,
+)
+def update_filters(start_date, end_date, companies, functions):
+    # answered from the pre-aggregated count tables, never the raw rows
+    watcher.poll()
+    tally = watcher.tally
+    weeks = week_range(tally, start_date, end_date)
+    return (
+        bar_top_companies(tally.company_counts(weeks, companies, functions), top_n=5),
+        bar_top_functions(tally.function_counts(weeks, companies, functions), top_n=5),
+        line_weekly(tally.weekly_frame(weeks, companies, functions)),
+    )
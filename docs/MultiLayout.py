@@ -1,13 +1,18 @@
 # docs/MultiLayout.py
 import dash
-from dash import html, dcc, Output, Input, callback
+from dash import html, dcc, Output, Input, callback, exceptions
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
 import requests
 import math
+import numpy as np
+import os
 import dash_bootstrap_components as dbc
 
+from ctba.background import background_options, manager, report
+from ctba.upstream import Refresher, TTLCache, make_session
+
 # ---------- Public API helper (Open-Meteo) ----------
 CITY_COORDS = {
     "Williamsburg": (37.2707, -76.7075),
@@ -19,19 +24,81 @@ CITY_COORDS = {
 
 dash.register_page(__name__, path="/weather", name="Open-Meteo Dashboard", order=6, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
+# Override to point at a local stub server when testing
+OPEN_METEO_URL = os.environ.get("CTBA_OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+
+# Forecasts change hourly: share one fetch per (lat, lon) across users,
+# keep serving the last one for a while as it refreshes in the background,
+# and for as long as Open-Meteo is down
+forecast_cache = TTLCache(
+    ttl=float(os.environ.get("CTBA_WEATHER_TTL", 600)),
+    stale_ttl=float(os.environ.get("CTBA_WEATHER_STALE_TTL", 3600)),
+)
+
+# One keep-alive connection pool (with retry/backoff) for every forecast call
+session = make_session(pool_size=len(CITY_COORDS))
+
 
-def fetch_hourly_temp(lat: float, lon: float) -> pd.DataFrame:
+def _fetch_hourly_temps(cities) -> pd.DataFrame:
+    """Every city's forecast from one request, as a tidy ``city, time, temp_C`` frame.
+
+    Open-Meteo takes comma-separated coordinate lists and answers with one
+    forecast per location, in the order asked (a bare object for just one).
+    """
+    lats = ",".join(str(CITY_COORDS[c][0]) for c in cities)
+    lons = ",".join(str(CITY_COORDS[c][1]) for c in cities)
     url = (
-        "https://api.open-meteo.com/v1/forecast"
-        f"?latitude={lat}&longitude={lon}"
+        f"{OPEN_METEO_URL}"
+        f"?latitude={lats}&longitude={lons}"
         "&hourly=temperature_2m&forecast_days=2&timezone=auto"
     )
-    r = requests.get(url, timeout=15)
+    r = session.get(url, timeout=15)
     r.raise_for_status()
-    data = r.json()["hourly"]
-    df = pd.DataFrame({"time": data["time"], "temp_C": data["temperature_2m"]})
-    df["time"] = pd.to_datetime(df["time"])
-    return df
+    body = r.json()
+    hourly = [f["hourly"] for f in (body if isinstance(body, list) else [body])]
+    if len(hourly) != len(cities):
+        raise ValueError(f"asked for {len(cities)} locations, got {len(hourly)}")
+    return pd.DataFrame({
+        "city": pd.Categorical(np.repeat(cities, [len(h["time"]) for h in hourly]), categories=cities),
+        "time": pd.to_datetime([t for h in hourly for t in h["time"]]),
+        "temp_C": np.array([v for h in hourly for v in h["temperature_2m"]], dtype=float),
+    })
+
+
+# Cache key of the batched forecast for every city
+ALL_CITIES = tuple(CITY_COORDS)
+
+
+def fetch_all_temps() -> pd.DataFrame:
+    """Cached tidy forecast for every city; shared, so don't modify it in place."""
+    return forecast_cache.get(ALL_CITIES, lambda: _fetch_hourly_temps(ALL_CITIES))
+
+
+def city_temps(tidy: pd.DataFrame, city: str) -> pd.DataFrame:
+    """One city's ``time, temp_C`` rows of the tidy forecast."""
+    return tidy.loc[tidy["city"] == city, ["time", "temp_C"]].reset_index(drop=True)
+
+
+def daily_stats(tidy: pd.DataFrame) -> pd.DataFrame:
+    """Daily min/max/mean for every city in one groupby, indexed by (city, Date)."""
+    return (
+        tidy.groupby(["city", tidy["time"].dt.date.rename("Date")], observed=True)["temp_C"]
+        .agg(["min", "max", "mean"])
+        .round(1)
+        .rename(columns={"min": "Min °C", "max": "Max °C", "mean": "Avg °C"})
+    )
+
+
+# Warm every city in the background, with one request per refresh, so the
+# callbacks only read memory
+refresher = Refresher(
+    forecast_cache,
+    {ALL_CITIES: lambda: _fetch_hourly_temps(ALL_CITIES)},
+    interval=float(os.environ.get("CTBA_WEATHER_REFRESH", 300)),
+)
+PREFETCH = os.environ.get("CTBA_WEATHER_PREFETCH", "1") == "1"
+if PREFETCH:
+    refresher.schedule()  # started per worker, never in a preloading master
 
 # ---------- Layout: Multi-column grid ----------
 navbar = dbc.Navbar(
@@ -59,6 +126,10 @@ controls = dbc.Card(
                 ),
                 html.Br(),
                 dbc.Button("Refresh", id="refresh", n_clicks=0, className="w-100"),
+                # Cancel only exists when the callback runs as a background job
+                *([dbc.Button("Cancel", id="cancel-weather", color="secondary",
+                              disabled=True, className="w-100 mt-2")] if manager else []),
+                html.Div(id="weather-status", className="text-muted small mt-2"),
                 html.Hr(),
                 html.Small("Data source: open-meteo.com (no API key required).", className="text-muted"),
             ]
@@ -92,6 +163,21 @@ chart_card = dbc.Card(
 
 table_card = dbc.Card([dbc.CardHeader("Summary Stats"), dbc.CardBody(html.Div(id="stats-table"))], className="g-3")
 
+compare_card = dbc.Card(
+    [
+        dbc.CardHeader("All Cities (next 48h)"),
+        dbc.CardBody(
+            dbc.Row(
+                [
+                    dbc.Col(dcc.Graph(id="compare-chart", config={"displayModeBar": False}), md=8),
+                    dbc.Col(html.Div(id="compare-table"), md=4),
+                ]
+            )
+        ),
+    ],
+    className="mt-3",
+)
+
 layout = dbc.Container(
     [
         navbar,
@@ -103,6 +189,7 @@ layout = dbc.Container(
             ],
             className="g-3",
         ),
+        compare_card,
         html.Footer(html.Small("Built with Dash + dash-bootstrap-components • Row/Col grid", className="text-muted"),
                     className="mt-4"),
     ],
@@ -118,10 +205,22 @@ layout = dbc.Container(
     Output("stats-table", "children"),
     Input("city-dd", "value"),
     Input("refresh", "n_clicks"),
+    running=[(Output("refresh", "disabled"), True, False)]
+            + ([(Output("cancel-weather", "disabled"), False, True)] if manager else []),
+    **background_options(cancel=[Input("cancel-weather", "n_clicks")]),
 )
 def update(city, _):
-    lat, lon = CITY_COORDS[city]
-    df = fetch_hourly_temp(lat, lon)
+    # served from memory while fresh (or stale, as it refreshes); fetched
+    # inline only when nothing usable is cached
+    if forecast_cache.peek(ALL_CITIES) is None:
+        report("weather-status", children=f"Fetching forecast for {city}…")
+    try:
+        tidy = fetch_all_temps()
+    except requests.RequestException as e:
+        report("weather-status", children=f"Forecast unavailable: {e}")
+        raise exceptions.PreventUpdate
+    report("weather-status", children=f"Forecast for {city} loaded {datetime.now():%H:%M}")
+    df = city_temps(tidy, city)
 
     now = df.iloc[0]["temp_C"]
     tmin = df["temp_C"].min()
@@ -131,16 +230,30 @@ def update(city, _):
     fig.update_layout(margin=dict(l=10, r=10, t=10, b=10),
                       yaxis_title="°C", xaxis_title="Time")
 
-    summary = (
-        df.assign(Date=df["time"].dt.date)
-        .groupby("Date")["temp_C"]
-        .agg(["min", "max", "mean"])
-        .round(1)
-        .rename(columns={"min": "Min °C", "max": "Max °C", "mean": "Avg °C"})
-        .reset_index()
-    )
+    summary = daily_stats(tidy).loc[city].reset_index()
     table = dbc.Table.from_dataframe(summary, striped=True, bordered=False, hover=True)
 
     fmt = lambda x: f"{x:.1f}"
     return fig, fmt(now), fmt(tmin), fmt(tmax), table
 
+
+@callback(
+    Output("compare-chart", "figure"),
+    Output("compare-table", "children"),
+    Input("refresh", "n_clicks"),
+    **background_options(),
+)
+def update_compare(_):
+    # one cached request and one groupby cover every city
+    try:
+        tidy = fetch_all_temps()
+    except requests.RequestException:
+        raise exceptions.PreventUpdate  # update() reports the error
+
+    fig = px.line(tidy, x="time", y="temp_C", color="city", title=None)
+    fig.update_layout(margin=dict(l=10, r=10, t=10, b=10),
+                      yaxis_title="°C", xaxis_title="Time", legend_title="City")
+
+    summary = daily_stats(tidy).reset_index().rename(columns={"city": "City"})
+    table = dbc.Table.from_dataframe(summary, striped=True, bordered=False, hover=True, size="sm")
+    return fig, table
@@ -3,9 +3,10 @@ import requests
 import dash
 from dash import html, dcc, Input, Output, exceptions, callback
 
-API_KEY = "DEMO_KEY"  # replace via env var on Render for higher limits
-APOD_URL = "https://api.nasa.gov/planetary/apod"
-MIN_DATE = dt.date(1995, 6, 16)
+# APOD entries come from a local store; set NASA_API_KEY on Render for higher limits
+from ctba.apod import MIN_DATE, get_apod
+from ctba.background import background_options
+
 TODAY = dt.date.today()
 
 dash.register_page(
@@ -35,6 +36,8 @@ layout = html.Div(
 @callback(
     [Output("media", "children"), Output("caption", "children")],
     Input("apod-date", "date"),
+    # a new date cancels the job still running for the previous one
+    **background_options(),
 )
 def show_apod(date_str):
     if not date_str:
@@ -44,11 +47,8 @@ def show_apod(date_str):
     except Exception:
         return "Invalid date.", ""
 
-    params = {"api_key": API_KEY, "date": date_obj.isoformat()}
     try:
-        r = requests.get(APOD_URL, params=params, timeout=10)
-        r.raise_for_status()
-        data = r.json()
+        data = get_apod(date_obj)
     except requests.RequestException as e:
         return f"API error: {e}", ""
 
@@ -1,32 +1,116 @@
 # docs/world_happiness.py
 import dash
-from dash import Dash, html, dcc, Input, Output, callback
+from dash import Dash, html, dcc, Input, Output, State, Patch, callback, clientside_callback, ClientsideFunction, ctx
+import os
 import pandas as pd
 import plotly.express as px
 from pathlib import Path
 
+from ctba.datasets import read_csv_typed
+from ctba.figcache import figure_cache
+from ctba.lazy import lazy
+from ctba.sqldb import SQL, csv_chunks, db
+from ctba.staticfigs import figure_key, urls
+from ctba.store import code_key, frame_key, source_key, store
+
 app = Dash(__name__)
 server = app.server  
 
 dash.register_page(__name__, path="/happy", name="World Happiness", order=3)
 
 DATA_PATH = Path(__file__).resolve().parent.parent / "data" / "world_happiness.csv"
-df = pd.read_csv(DATA_PATH).rename(columns={
-    "country": "Country",
-    "year": "Year",
-    "Life Ladder": "Happiness Score"
-})
-df["Year"] = pd.to_numeric(df["Year"], errors="coerce").astype(int)
-
-layout = html.Div(
-    style={'padding': '20px', 'backgroundColor': "#B9975B"},
-    children=[
+
+
+def read_scores():
+    # not read_csv_cached: the store is the cache
+    df = read_csv_typed(DATA_PATH).rename(columns={
+        "country": "Country",
+        "year": "Year",
+        "Life Ladder": "Happiness Score"
+    })
+    df["Year"] = pd.to_numeric(df["Year"], errors="coerce").astype("int16")
+    return df
+
+
+# memory-mapped from the shared store, one copy for all workers
+@lazy("happy.scores", backend="pandas")
+def scores():
+    return store.frame("happy.scores", read_scores, key=frame_key(DATA_PATH, read_scores))
+
+
+# With CTBA_BACKEND=sqlite each year is read from an indexed table instead
+@lazy("happy.db", backend="sqlite")
+def scores_db():
+    columns = {'Life Ladder': 'score'}
+    return db.table(
+        'world_happiness', lambda: (c.rename(columns=columns) for c in csv_chunks(DATA_PATH)),
+        key=source_key(DATA_PATH), indexes=[('year', 'country'), ('country', 'year')],
+    )
+
+
+def years():
+    if SQL:
+        return db.query(f'SELECT DISTINCT year FROM {scores_db.get()} ORDER BY year')['year'].tolist()
+    return sorted(scores.get()['Year'].unique())
+
+
+def year_scores(selected_year):
+    """The year's rows, in file order."""
+    if SQL:
+        return db.query(
+            'SELECT country AS "Country", region, happiness_rank, score AS "Happiness Score", year AS "Year" '
+            f'FROM {scores_db.get()} WHERE year = ? ORDER BY rowid',
+            [int(selected_year)],
+        )
+    df = scores.get()
+    return df[df['Year'] == int(selected_year)]
+
+
+# Ship per-year values once and switch years in the browser (assets/clientside.js)
+CLIENTSIDE = os.environ.get("CTBA_CLIENTSIDE", "0") == "1"
+# After the first render, send only the values that change between years
+PATCH = os.environ.get("CTBA_PATCH", "1") == "1"
+
+
+# the figures' code: figures cached or exported by an older version don't match
+FIGURE_CODE = code_key(Path(__file__))
+
+
+def static_key():
+    return f"{source_key(DATA_PATH)}|code:{FIGURE_CODE}"
+
+
+# Figures precomputed by `python -m ctba.staticfigs` for this CSV, if any
+STATIC = {} if CLIENTSIDE else urls('WorldHappy', static_key())
+
+
+def top_bottom(d):
+    return pd.concat([d.nlargest(10, 'Happiness Score'),
+                      d.nsmallest(10, 'Happiness Score')]).sort_values('Happiness Score')
+
+
+def build_client_table(data):
+    years = {}
+    for year, d in data.groupby('Year', observed=True):
+        tb = top_bottom(d)
+        years[str(year)] = {
+            'countries': d['Country'].tolist(),
+            'scores': d['Happiness Score'].tolist(),
+            'bar_countries': tb['Country'].tolist(),
+            'bar_scores': tb['Happiness Score'].tolist(),
+        }
+    return {'years': years}
+
+
+def layout(**kwargs):
+    year_list = years()
+    children = [
         html.H1("World Happiness Dashboard", style={'textAlign': 'center', 'color': '#0c2d3e'}),
         html.Div(
             dcc.Dropdown(
                 id='year-dropdown',
-                options=[{'label': str(y), 'value': y} for y in sorted(df['Year'].unique())],
-                value=int(df['Year'].max()),
+                options=[{'label': str(y), 'value': y} for y in year_list],
+                value=int(year_list[-1]),
                 clearable=False,
                 style={'width': '50%'}
             ),
@@ -35,28 +119,104 @@ layout = html.Div(
         dcc.Graph(id='happiness-map'),
         dcc.Graph(id='top-bottom-bar'),
     ]
-)
+    if CLIENTSIDE:
+        children.append(dcc.Store(id='happiness-table', data=client_table.get()))
+    elif STATIC:
+        children.append(dcc.Store(id='happiness-src'))
+    return html.Div(style={'padding': '20px', 'backgroundColor': "#B9975B"}, children=children)
+
 
-@callback(
-    Output('happiness-map', 'figure'),
-    Output('top-bottom-bar', 'figure'),
-    Input('year-dropdown', 'value')
-)
+@figure_cache.memoize("happy.update_dashboard", version=static_key)
 def update_dashboard(selected_year):
-    d = df[df['Year'] == int(selected_year)]
+    d = year_scores(selected_year)
     map_fig = px.choropleth(
         d, locations="Country", locationmode="country names",
         color="Happiness Score", hover_name="Country",
         color_continuous_scale="viridis",
         title=f"Happiness Score by Country - {selected_year}"
     )
-    top_bottom = pd.concat([d.nlargest(10, 'Happiness Score'),
-                            d.nsmallest(10, 'Happiness Score')])
     bar_fig = px.bar(
-        top_bottom.sort_values('Happiness Score'),
+        top_bottom(d),
         x='Happiness Score', y='Country', orientation='h',
         color='Happiness Score',
         title=f"Top and Bottom 10 Countries - {selected_year}",
         color_continuous_scale='RdYlGn'
     )
     return map_fig, bar_fig
+
+
+def patch_dashboard(selected_year):
+    """Swap the year's values into the figures already on the page."""
+    d = year_scores(selected_year)
+    tb = top_bottom(d)
+    countries = d['Country'].tolist()
+
+    map_patch = Patch()
+    map_patch['data'][0]['locations'] = countries
+    map_patch['data'][0]['z'] = d['Happiness Score'].tolist()
+    map_patch['data'][0]['hovertext'] = countries
+    map_patch['layout']['title']['text'] = f"Happiness Score by Country - {selected_year}"
+
+    bar_patch = Patch()
+    bar_scores = tb['Happiness Score'].tolist()
+    bar_patch['data'][0]['x'] = bar_scores
+    bar_patch['data'][0]['y'] = tb['Country'].tolist()
+    bar_patch['data'][0]['marker']['color'] = bar_scores
+    bar_patch['layout']['title']['text'] = f"Top and Bottom 10 Countries - {selected_year}"
+    return map_patch, bar_patch
+
+
+def static_figures():
+    """Both figures for every year in the dropdown (see ctba.staticfigs)."""
+    for year in years():
+        map_fig, bar_fig = update_dashboard.uncached(int(year))
+        yield 'map', (int(year),), map_fig
+        yield 'bar', (int(year),), bar_fig
+
+
+def dashboard_source(selected_year):
+    """URLs of the precomputed map and bar chart for this year."""
+    key = figure_key(int(selected_year))
+    return [STATIC['map'].get(key), STATIC['bar'].get(key)]
+
+
+def dashboard_update(selected_year):
+    if not PATCH or ctx.triggered_id is None:  # first render: no figures to patch yet
+        return update_dashboard(selected_year)
+    return patch_dashboard(selected_year)
+
+
+if CLIENTSIDE:
+    @lazy("happy.client_table")
+    def client_table():
+        # first figures are built once on the server and restyled from then on
+        df = scores.get()
+        return {**build_client_table(df), 'templates': update_dashboard(int(df['Year'].max()))}
+
+    clientside_callback(
+        ClientsideFunction(namespace='ctba', function_name='happinessFigures'),
+        Output('happiness-map', 'figure'),
+        Output('top-bottom-bar', 'figure'),
+        Input('year-dropdown', 'value'),
+        State('happiness-table', 'data'),
+        State('happiness-map', 'figure'),
+        State('top-bottom-bar', 'figure'),
+    )
+elif STATIC:
+    callback(
+        Output('happiness-src', 'data'),
+        Input('year-dropdown', 'value')
+    )(dashboard_source)
+
+    clientside_callback(
+        ClientsideFunction(namespace='ctba', function_name='loadFigures'),
+        Output('happiness-map', 'figure'),
+        Output('top-bottom-bar', 'figure'),
+        Input('happiness-src', 'data'),
+    )
+else:
+    callback(
+        Output('happiness-map', 'figure'),
+        Output('top-bottom-bar', 'figure'),
+        Input('year-dropdown', 'value')
+    )(dashboard_update)
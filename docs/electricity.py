@@ -1,10 +1,21 @@
 # docs/electricity.py
 import dash
-from dash import Dash, html, dcc, Input, Output, callback
+from dash import Dash, html, dcc, Input, Output, State, Patch, callback, clientside_callback, ClientsideFunction, ctx
+import os
 import pandas as pd
 import plotly.express as px
+import plotly.graph_objects as go
 from pathlib import Path
 
+from ctba.datasets import read_csv_typed
+from ctba import downsample
+from ctba.downsample import lttb
+from ctba.figcache import figure_cache
+from ctba.lazy import lazy
+from ctba.sqldb import SQL, csv_chunks, db
+from ctba.staticfigs import figure_key, urls
+from ctba.store import code_key, frame_key, source_key, store
+
 app = Dash(__name__)
 server = app.server  
 
@@ -12,38 +23,273 @@ dash.register_page(__name__, path="/electricity", name="Electricity", order=2)
 
 DATA_PATH = Path(__file__).resolve().parent.parent / "data" / "electricity_prices.csv"
 
-df = pd.read_csv(DATA_PATH)
 
-df.columns = [c.strip() for c in df.columns]
-df["year"] = pd.to_numeric(df["year"], errors="coerce").astype(int)
+def read_prices():
+    df = read_csv_typed(DATA_PATH)  # not read_csv_cached: the store is the cache
+
+    df.columns = [c.strip() for c in df.columns]
+    df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("int16")
+    return df
+
+
+# Both frames are memory-mapped from the shared store, one copy for all workers
+@lazy("electricity.prices", backend="pandas")
+def prices():
+    return store.frame("electricity.prices", read_prices, key=frame_key(DATA_PATH, read_prices))
+
+
+# With CTBA_BACKEND=sqlite the CSV is read from an indexed table instead
+@lazy("electricity.db", backend="sqlite")
+def price_db():
+    return db.table(
+        "electricity_prices", lambda: csv_chunks(DATA_PATH), key=source_key(DATA_PATH),
+        indexes=[("year", "sectorName", "month", "state"), ("state", "sectorName", "year", "month")],
+    )
+
+
+# ---------- Pre-aggregated (year, sector, month) -> state price cube ----------
+MONTH_NAMES = ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+               "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+DEFAULT_SECTOR = "residential"
+# Drill-down: most states compared at once, and points per series figure
+MAX_COMPARE = 8
+SERIES_POINTS = int(os.environ.get("CTBA_SERIES_POINTS", 2000))
+# Ship the cube to the browser and switch years there (assets/clientside.js)
+CLIENTSIDE = os.environ.get("CTBA_CLIENTSIDE", "0") == "1"
+
+
+# the figures' code: figures cached or exported by an older version don't match
+FIGURE_CODE = code_key(Path(__file__), downsample)
+
+
+def static_key():
+    return f"{source_key(DATA_PATH)}|code:{FIGURE_CODE}"
+
+
+# Maps precomputed by `python -m ctba.staticfigs` for this CSV, if any
+STATIC = {} if CLIENTSIDE else urls("electricity", static_key())
+# After the first render, send only the values that change (locations, z, title)
+PATCH = os.environ.get("CTBA_PATCH", "1") == "1"
+
+
+def weighted_price(sums: pd.DataFrame) -> pd.DataFrame:
+    """Add the sales-weighted ``price`` (cents/kWh) to summed revenue and sales."""
+    sums["price"] = (sums["revenue"] / sums["sales"].where(sums["sales"] > 0) * 100).round(2)
+    return sums.dropna(subset=["price"])
+
+
+def build_price_table(data: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate once into rows of (year, sector, month, state, price).
+
+    month is 0 for the whole-year rows, which come after the monthly ones.
+    Prices are sales-weighted (revenue / sales, in cents/kWh) so each state
+    gets exactly one row per slice.
+    """
+    def weighted(keys):
+        return weighted_price(data.groupby(keys + ["state"], observed=True)[["revenue", "sales"]].sum().reset_index())
+
+    monthly = weighted(["year", "sectorName", "month"])
+    yearly = weighted(["year", "sectorName"]).assign(month=0)
+    cols = ["year", "sectorName", "month", "state", "price"]
+    table = pd.concat([monthly[cols], yearly[cols]], ignore_index=True)
+    table["month"] = table["month"].astype("int8")
+    return table.rename(columns={"sectorName": "sector"})
+
+
+def cube_from_table(table: pd.DataFrame) -> dict:
+    """{(year, sector, month): frame[state, price]}, month None for the whole year.
+
+    Each slice is a view of ``table``'s contiguous rows, not a copy.
+    """
+    cube = {}
+    groups = table.groupby(["year", "sector", "month"], sort=False, observed=True).indices
+    for (year, sector, month), rows in groups.items():
+        part = table.iloc[rows[0]:rows[-1] + 1]
+        cube[(int(year), sector, int(month) or None)] = part[["state", "price"]].reset_index(drop=True)
+    return cube
+
+
+def build_price_cube(data: pd.DataFrame) -> dict:
+    return cube_from_table(build_price_table(data))
+
+
+@lazy("electricity.table", backend="pandas")
+def price_table():
+    return store.frame("electricity.cube", lambda: build_price_table(prices.get()),
+                       key=frame_key(DATA_PATH, read_prices, weighted_price, build_price_table))
+
+
+@lazy("electricity.cube", backend="pandas")
+def price_cube():
+    return cube_from_table(price_table.get())
+
+
+@lazy("electricity.series", backend="pandas")
+def state_series():
+    """{(state, sector): frame[date, price]}: every monthly price, in date order."""
+    t = price_table.get()
+    t = t[t["month"] > 0]
+    t = t.assign(date=pd.to_datetime({"year": t["year"], "month": t["month"], "day": 1}))
+    t = t.sort_values("date", kind="stable")
+    return {
+        (state, sector): part[["date", "price"]].reset_index(drop=True)
+        for (state, sector), part in t.groupby(["state", "sector"], observed=True)
+    }
+
+
+def cube_axes(cube: dict) -> tuple[list, list]:
+    """Sorted years and sectors present in the cube."""
+    return sorted({y for y, _, _ in cube}), sorted({s for _, s, _ in cube})
+
+
+# ---------- Reads shared by both backends ----------
+def price_axes() -> tuple[list, list]:
+    """Sorted years and sectors with prices."""
+    if not SQL:
+        return cube_axes(price_cube.get())
+    table = price_db.get()
+    years = db.query(f"SELECT DISTINCT year FROM {table} WHERE sales > 0 ORDER BY year")["year"]
+    sectors = db.query(f"SELECT DISTINCT sectorName FROM {table} WHERE sales > 0 ORDER BY sectorName")["sectorName"]
+    return [int(y) for y in years], sectors.tolist()
+
+
+def price_slice(year: int, sector: str, month=None):
+    """frame[state, price] for one map (month None: whole year), or None."""
+    if not SQL:
+        return price_cube.get().get((year, sector, month))
+    params = [year, sector] + ([] if month is None else [month])
+    sums = db.query(
+        f"SELECT state, SUM(revenue) AS revenue, SUM(sales) AS sales FROM {price_db.get()} "
+        f"WHERE year = ? AND sectorName = ?{'' if month is None else ' AND month = ?'} "
+        "GROUP BY state ORDER BY state",
+        params,
+    )
+    d = weighted_price(sums)[["state", "price"]].reset_index(drop=True)
+    return d if len(d) else None
+
+
+@lazy("electricity.series_keys")
+def series_keys():
+    """{(state, sector)} with a monthly price series."""
+    if not SQL:
+        return set(state_series.get())
+    rows = db.query(f"SELECT DISTINCT state, sectorName FROM {price_db.get()} WHERE sales > 0")
+    return set(zip(rows["state"], rows["sectorName"]))
+
+
+def price_series(state: str, sector: str) -> pd.DataFrame:
+    """frame[date, price]: every monthly price of one state and sector, in date order."""
+    if not SQL:
+        return state_series.get()[(state, sector)]
+    sums = weighted_price(db.query(
+        f"SELECT year, month, SUM(revenue) AS revenue, SUM(sales) AS sales FROM {price_db.get()} "
+        "WHERE state = ? AND sectorName = ? GROUP BY year, month ORDER BY year, month",
+        [state, sector],
+    ))
+    return pd.DataFrame({
+        "date": pd.to_datetime({"year": sums["year"], "month": sums["month"], "day": 1}),
+        "price": sums["price"],
+    }).reset_index(drop=True)
+
 
-layout = html.Div(
-    style={"backgroundColor": "#32453C", "padding": "20px", "minHeight": "100vh"},
-    children=[
+def build_client_table(cube: dict) -> dict:
+    """Compact form of the cube for the browser.
+
+    values[sector][month or "all"][i] holds the prices for years[i], one
+    per entry of ``states`` (null where a state has no data).
+    """
+    years, sectors = cube_axes(cube)
+    states = sorted({s for part in cube.values() for s in part["state"]})
+    values = {}
+    for (year, sector, month), part in cube.items():
+        row = part.set_index("state")["price"].reindex(states)
+        by_year = values.setdefault(sector, {}).setdefault("all" if month is None else str(month), {})
+        by_year[year] = [None if pd.isna(v) else float(v) for v in row]
+    return {
+        "years": years,
+        "states": states,
+        "months": MONTH_NAMES,
+        "sectorLabels": {s: s.title() for s in sectors},
+        "values": {
+            sector: {m: [by_year.get(y, []) for y in years] for m, by_year in months.items()}
+            for sector, months in values.items()
+        },
+    }
+
+
+def layout(**kwargs):
+    years, sectors = price_axes()
+    children = [
         html.H1("Electricity Prices by US State",
                 style={"color": "#115740", "textAlign": "center"}),
 
+        html.Div(
+            style={"display": "flex", "gap": "12px", "marginBottom": "12px"},
+            children=[
+                dcc.Dropdown(
+                    id="sector-dropdown",
+                    options=[{"label": s.title(), "value": s} for s in sectors],
+                    value=DEFAULT_SECTOR,
+                    clearable=False,
+                    style={"width": "240px"},
+                ),
+                dcc.Dropdown(
+                    id="month-dropdown",
+                    options=[{"label": "All months", "value": "all"}]
+                            + [{"label": m, "value": i} for i, m in enumerate(MONTH_NAMES, start=1)],
+                    value="all",
+                    clearable=False,
+                    style={"width": "180px"},
+                ),
+            ],
+        ),
+
         dcc.Slider(
             id="year-slider",
-            min=int(df["year"].min()),
-            max=int(df["year"].max()),
-            value=int(df["year"].min()),
-            marks={str(y): str(y) for y in sorted(df["year"].unique())},
+            min=int(years[0]),
+            max=int(years[-1]),
+            value=int(years[0]),
+            marks={str(y): str(y) for y in years},
             step=None,
             tooltip={"placement": "bottom", "always_visible": True},
         ),
 
         html.Div(style={"height": "12px"}),
         dcc.Graph(id="choropleth-map"),
-    ],
-)
 
-@callback(
-    Output("choropleth-map", "figure"),
-    Input("year-slider", "value"),
-)
-def update_map(selected_year):
-    d = df[df["year"] == int(selected_year)]
+        dcc.Dropdown(
+            id="drill-states",
+            options=sorted({state for state, _ in series_keys.get()}),
+            value=[],
+            multi=True,
+            placeholder="Click a state on the map, or pick states to compare",
+            style={"marginTop": "12px"},
+        ),
+        dcc.Graph(id="state-series", figure=series_figure([])),
+    ]
+    if CLIENTSIDE:
+        children.append(dcc.Store(id="price-table", data=client_table.get()))
+    elif STATIC:
+        children.append(dcc.Store(id="choropleth-src"))
+    return html.Div(
+        style={"backgroundColor": "#32453C", "padding": "20px", "minHeight": "100vh"},
+        children=children,
+    )
+
+
+def map_slice(selected_year, sector, month):
+    """(frame[state, price], title) for one slider/dropdown combination."""
+    month = None if month in (None, "all") else int(month)
+    d = price_slice(int(selected_year), sector, month)
+    if d is None:
+        d = pd.DataFrame({"state": pd.Series(dtype=str), "price": pd.Series(dtype=float)})
+    period = str(selected_year) if month is None else f"{MONTH_NAMES[month - 1]} {selected_year}"
+    return d, f"{sector.title()} Electricity Prices — {period}"
+
+
+@figure_cache.memoize("electricity.update_map", version=static_key)
+def update_map(selected_year, sector=DEFAULT_SECTOR, month="all"):
+    d, title = map_slice(selected_year, sector, month)
     fig = px.choropleth(
         d,
         locations="state",              # two-letter codes
@@ -52,10 +298,140 @@ def update_map(selected_year):
         scope="usa",
         color_continuous_scale="Reds",
         labels={"price": "Price (cents/kWh)"},
-        title=f"Residential Electricity Prices — {selected_year}",
+        title=title,
     )
     fig.update_layout(geo=dict(bgcolor="#B9975B"),
                       paper_bgcolor="#32453C",
                       font_color="white",
                       margin=dict(l=10, r=10, t=50, b=10))
     return fig
+
+
+def patch_map(selected_year, sector=DEFAULT_SECTOR, month="all"):
+    """Update the map already on the page in place; the trace style and layout stay put."""
+    d, title = map_slice(selected_year, sector, month)
+    patched = Patch()
+    patched["data"][0]["locations"] = d["state"].tolist()
+    patched["data"][0]["z"] = d["price"].tolist()
+    patched["layout"]["title"]["text"] = title
+    return patched
+
+
+def series_traces(states, sector):
+    """(state, sector, trace name) per line: one state is shown with all of its
+    sectors, several states are compared on the selected sector."""
+    series = series_keys.get()
+    if len(states) == 1:
+        pairs = [(states[0], s, s.title()) for s in sorted({s for st, s in series if st == states[0]})]
+    else:
+        pairs = [(st, sector, st) for st in states]
+    return [(st, s, name) for st, s, name in pairs if (st, s) in series]
+
+
+@figure_cache.memoize("electricity.series_figure", version=static_key)
+def series_figure(states, sector=DEFAULT_SECTOR):
+    states = list(states or [])
+    pairs = series_traces(states, sector)
+    fig = go.Figure()
+    # split the point budget between traces; longer series are LTTB-downsampled
+    per_trace = max(SERIES_POINTS // max(len(pairs), 1), 3)
+    for state, sec, name in pairs:
+        d = price_series(state, sec)
+        x, y = lttb(d["date"], d["price"], per_trace)
+        fig.add_trace(go.Scattergl(x=x, y=y, mode="lines", name=name))
+    if not states:
+        title = "Monthly prices — click a state on the map"
+    elif len(states) == 1:
+        title = f"{states[0]} Monthly Electricity Prices by Sector"
+    else:
+        title = f"{sector.title()} Monthly Electricity Prices — {', '.join(states)}"
+    fig.update_layout(title=title,
+                      paper_bgcolor="#32453C",
+                      plot_bgcolor="#B9975B",
+                      font_color="white",
+                      yaxis_title="Price (cents/kWh)",
+                      hovermode="x unified",
+                      margin=dict(l=10, r=10, t=50, b=10))
+    return fig
+
+
+@callback(
+    Output("drill-states", "value"),
+    Input("choropleth-map", "clickData"),
+    State("drill-states", "value"),
+    prevent_initial_call=True,
+)
+def add_clicked_state(click, states):
+    if not click or not click.get("points"):
+        return dash.no_update
+    state = click["points"][0].get("location")
+    states = [s for s in (states or []) if s != state]
+    return (states + [state])[-MAX_COMPARE:]
+
+
+@callback(
+    Output("state-series", "figure"),
+    Input("drill-states", "value"),
+    Input("sector-dropdown", "value"),
+    prevent_initial_call=True,
+)
+def update_series(states, sector):
+    return series_figure(sorted(states or []), sector)
+
+
+def static_figures():
+    """Every map the slider and dropdowns can ask for (see ctba.staticfigs)."""
+    years, sectors = price_axes()
+    for year in years:
+        for sector in sectors:
+            for month in ["all", *range(1, 13)]:
+                yield "map", (year, sector, month), update_map.uncached(year, sector, month)
+
+
+def map_source(selected_year, sector, month):
+    """URL of the precomputed map for these inputs."""
+    return STATIC["map"].get(figure_key(int(selected_year), sector, month))
+
+
+def map_update(selected_year, sector, month):
+    if not PATCH or ctx.triggered_id is None:  # first render: no figure to patch yet
+        return update_map(selected_year, sector, month)
+    return patch_map(selected_year, sector, month)
+
+
+if CLIENTSIDE:
+    @lazy("electricity.client_table")
+    def client_table():
+        # the first figure is built once on the server and restyled from then on
+        cube = price_cube.get()
+        return {**build_client_table(cube), "template": update_map(cube_axes(cube)[0][0])}
+
+    clientside_callback(
+        ClientsideFunction(namespace="ctba", function_name="electricityMap"),
+        Output("choropleth-map", "figure"),
+        Input("year-slider", "value"),
+        Input("sector-dropdown", "value"),
+        Input("month-dropdown", "value"),
+        State("price-table", "data"),
+        State("choropleth-map", "figure"),
+    )
+elif STATIC:
+    callback(
+        Output("choropleth-src", "data"),
+        Input("year-slider", "value"),
+        Input("sector-dropdown", "value"),
+        Input("month-dropdown", "value"),
+    )(map_source)
+
+    clientside_callback(
+        ClientsideFunction(namespace="ctba", function_name="loadFigures"),
+        Output("choropleth-map", "figure"),
+        Input("choropleth-src", "data"),
+    )
+else:
+    callback(
+        Output("choropleth-map", "figure"),
+        Input("year-slider", "value"),
+        Input("sector-dropdown", "value"),
+        Input("month-dropdown", "value"),
+    )(map_update)
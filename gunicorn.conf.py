@@ -0,0 +1,49 @@
+# gunicorn.conf.py — picked up automatically by `gunicorn app:server`
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+# Threaded workers: a callback waiting on NASA or Open-Meteo holds one
+# thread, not the whole worker, so the other pages keep being served.
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+
+# CTBA_PRELOAD=1: import the app and load every dataset/figure once in the
+# master, so forked workers share them copy-on-write instead of each
+# loading their own on first visit.
+preload_app = os.environ.get("CTBA_PRELOAD", "0") == "1"
+
+
+def when_ready(server):
+    if preload_app:
+        import gc
+        from ctba.lazy import load_all
+
+        server.log.info("Preloaded %s", ", ".join(load_all()))
+        # keep the loaded objects out of future GC passes, which would
+        # otherwise touch (and un-share) their pages in every worker
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        # the master only scheduled the pages' refreshers; start them in
+        # each worker at boot rather than on its first request
+        from ctba.upstream import start_refreshers
+
+        start_refreshers()
+
+
+# CTBA_METRICS=1: workers write their samples to a shared directory so
+# /metrics reports all of them, whichever worker answers the scrape
+if os.environ.get("CTBA_METRICS", "0") == "1":
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="ctba-metrics-"))
+
+
+def child_exit(server, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,31 @@
+# tests/conftest.py
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# keep upstream breakers in memory, not in the instance's shared file
+os.environ.setdefault("CTBA_BREAKER_DB", "")
+
+from bench.stubs import StubServer  # noqa: E402
+from ctba import upstream  # noqa: E402
+
+
+@pytest.fixture
+def stub():
+    """A local stand-in for the Open-Meteo and APOD APIs."""
+    server = StubServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(autouse=True)
+def closed_breakers():
+    upstream.guards.clear()
+    upstream.board = None
+    yield
+    upstream.guards.clear()
+    upstream.board = None
@@ -0,0 +1,89 @@
+# tests/test_apod.py
+import datetime as dt
+import time
+
+import pytest
+import requests
+
+from ctba import apod
+
+DAY = dt.date(2020, 3, 1)
+
+
+@pytest.fixture
+def store(tmp_path, stub, monkeypatch):
+    store = apod.ApodStore(tmp_path / "apod.sqlite")
+    monkeypatch.setattr(apod, "store", store)
+    monkeypatch.setattr(apod, "APOD_URL", stub.url + "/planetary/apod")
+    return store
+
+
+def test_past_entry_is_fetched_once(stub, store):
+    first = apod.get_apod(DAY)
+    second = apod.get_apod(DAY)
+    assert first == second
+    assert first["date"] == DAY.isoformat()
+    assert stub.requests == 1
+
+
+def test_today_expires(stub, store, monkeypatch):
+    today = dt.date.today()
+    store.put_many([{**apod.get_apod(today), "title": "old"}], fetched_at=time.time() - 2 * apod.TODAY_TTL)
+    assert apod.get_apod(today)["title"] != "old"
+    assert stub.requests == 2
+
+
+def test_entry_stored_on_its_own_day_expires(stub, store):
+    # cached the day it was published, then the day ended
+    during = dt.datetime.combine(DAY, dt.time(12)).timestamp()
+    store.put_many([{"date": DAY.isoformat(), "title": "partial"}], fetched_at=during)
+    assert apod.get_apod(DAY)["title"] != "partial"
+    assert stub.requests == 1
+    apod.get_apod(DAY)  # refetched after the day ended: final
+    assert stub.requests == 1
+
+
+def test_expired_entry_is_served_while_the_api_fails(stub, store):
+    today = dt.date.today()
+    store.put_many([{"date": today.isoformat(), "title": "last good"}], fetched_at=time.time() - 2 * apod.TODAY_TTL)
+    stub.error_rate = 1.0
+    assert apod.get_apod(today)["title"] == "last good"
+
+
+def test_api_error_without_stored_entry(stub, store):
+    stub.error_rate = 1.0
+    with pytest.raises(requests.RequestException):
+        apod.get_apod(DAY)
+
+
+def test_backfill_uses_range_requests(stub, store):
+    end = DAY + dt.timedelta(days=24)
+    assert apod.backfill(DAY, end, chunk_days=10) == 25
+    assert stub.requests == 3
+    assert store.dates() == {DAY + dt.timedelta(days=i) for i in range(25)}
+    apod.get_apod(DAY + dt.timedelta(days=5))
+    assert stub.requests == 3
+
+
+def test_backfill_does_not_refetch_gap_days(stub, store):
+    # the archive has no entries for 1995-06-17..19
+    stub.apod_gaps = {dt.date(1995, 6, 17), dt.date(1995, 6, 18), dt.date(1995, 6, 19)}
+    end = apod.MIN_DATE + dt.timedelta(days=29)
+    assert apod.backfill(apod.MIN_DATE, end, chunk_days=10) == 27
+    assert stub.requests == 3
+    assert apod.backfill(apod.MIN_DATE, end, chunk_days=10) == 0
+    assert stub.requests == 3
+
+
+def test_store_is_created_on_first_use(tmp_path):
+    path = tmp_path / "sub" / "apod.sqlite"
+    store = apod.ApodStore(path)
+    assert not path.parent.exists()
+    assert store.get(DAY) is None
+    assert path.exists()
+
+
+def test_unwritable_store_still_answers_from_the_api(stub, monkeypatch):
+    monkeypatch.setattr(apod, "store", apod.ApodStore("/dev/null/cache/apod.sqlite"))
+    monkeypatch.setattr(apod, "APOD_URL", stub.url + "/planetary/apod")
+    assert apod.get_apod(DAY)["date"] == DAY.isoformat()
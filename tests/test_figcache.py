@@ -0,0 +1,33 @@
+# tests/test_figcache.py
+import os
+
+from ctba.figcache import FigureCache
+
+
+def test_version_is_part_of_the_key(tmp_path):
+    version = "v1"
+    cache = FigureCache(disk_dir=tmp_path)
+    calls = []
+
+    @cache.memoize("fig", version=lambda: version)
+    def fig(x):
+        calls.append(x)
+        return {"data": [x]}
+
+    fig(1)
+    fig(1)
+    version = "v2"  # new data or a new deploy: the old figure isn't replayed
+    assert fig(1) == {"data": [1]}
+    assert calls == [1, 1]
+
+
+def test_disk_mirror_is_capped(tmp_path):
+    cache = FigureCache(disk_dir=tmp_path, disk_max_bytes=10_000)
+    payload = "x" * 1000
+    for i in range(30):
+        cache.put(f"k{i}", payload)
+        os.utime(cache._disk_path(f"k{i}"), (i, i))  # written in order
+    sizes = [p.stat().st_size for p in tmp_path.glob("*.json")]
+    assert sum(sizes) <= 10_000
+    assert cache._disk_path("k29").exists()
+    assert not cache._disk_path("k0").exists()
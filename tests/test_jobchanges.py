@@ -0,0 +1,52 @@
+# tests/test_jobchanges.py
+import pandas as pd
+import pytest
+
+from ctba.jobchanges import COMPANY, DIRECTION, ENDED, FUNCTION, STARTED, JobChangeWatcher, SQLJobChangeTally, week_start
+from ctba.sqldb import QueryDB
+
+
+def drop(rows):
+    df = pd.DataFrame(rows, columns=[DIRECTION, COMPANY, FUNCTION, STARTED, ENDED, "linkedin"])
+    df[ENDED] = pd.to_datetime(df[ENDED], utc=True)
+    df[STARTED] = pd.to_datetime(df[STARTED], utc=True)
+    df["week"] = week_start(df[ENDED])
+    return df
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    (tmp_path / "drops").mkdir()
+    (tmp_path / "drops" / "jobs-1.csv").write_text("x\n")
+    return tmp_path / "drops"
+
+
+def watcher(tmp_path, data_dir, reads):
+    def loader(path):
+        reads.append(path.name)
+        return drop([
+            ["departure", "Acme", "Sales", "2025-06-02T00:00:00Z", "2025-06-01T00:00:00Z", "a"],
+            ["departure", "Initech", "Engineering", "2025-06-09T00:00:00Z", "2025-06-08T00:00:00Z", "b"],
+        ])
+
+    return JobChangeWatcher(data_dir, "jobs-*.csv", loader, min_interval=0,
+                            tally=SQLJobChangeTally(QueryDB(tmp_path / "ctba.sqlite")))
+
+
+def test_sql_tally_skips_drops_already_ingested(tmp_path, data_dir):
+    reads = []
+    first = watcher(tmp_path, data_dir, reads)
+    assert [p.name for p in first.poll()] == ["jobs-1.csv"]
+    assert first.tally.rows == 2
+
+    # a worker starting on the same database reads no drop again
+    second = watcher(tmp_path, data_dir, reads)
+    assert [p.name for p in second.poll()] == ["jobs-1.csv"]
+    assert reads == ["jobs-1.csv"]
+    assert second.tally.company_counts().to_dict() == {"Acme": 1, "Initech": 1}
+
+    # a rewritten drop is read again
+    (data_dir / "jobs-1.csv").write_text("x,y\n")
+    second.poll()
+    assert reads == ["jobs-1.csv", "jobs-1.csv"]
+    assert second.tally.rows == 2
@@ -0,0 +1,236 @@
+# tests/test_upstream.py
+import threading
+import time
+
+import pytest
+import requests
+
+from ctba.upstream import (
+    CircuitBreaker, HostGuard, MemoryBoard, SQLiteBoard, TTLCache, UpstreamUnavailable, make_session,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def fetch(stub):
+    """A forecast fetch from the stub that returns (call number, payload)."""
+    session = make_session(pool_size=16, retries=0)
+    calls = []
+
+    def fetch():
+        r = session.get(stub.url + "/v1/forecast", params={"latitude": 37.27, "longitude": -76.71}, timeout=5)
+        r.raise_for_status()
+        calls.append(1)
+        return len(calls), r.json()
+
+    return fetch
+
+
+def test_concurrent_misses_are_coalesced(stub, fetch):
+    stub.latency = 0.2
+    cache = TTLCache(ttl=60)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("k", fetch))) for _ in range(10)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert stub.requests == 1
+    assert len({n for n, _ in results}) == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 9
+
+
+def test_entries_expire_after_ttl(stub, fetch):
+    clock = Clock()
+    cache = TTLCache(ttl=10, clock=clock)
+    assert cache.get("k", fetch)[0] == 1
+    clock.now = 9
+    assert cache.get("k", fetch)[0] == 1
+    clock.now = 11
+    assert cache.get("k", fetch)[0] == 2
+    assert stub.requests == 2
+
+
+def test_stale_entry_is_served_while_one_refresh_runs(stub, fetch):
+    clock = Clock()
+    cache = TTLCache(ttl=10, stale_ttl=60, clock=clock)
+    cache.get("k", fetch)
+    stub.latency = 0.3
+    clock.now = 20
+    t0 = time.perf_counter()
+    assert [cache.get("k", fetch)[0] for _ in range(5)] == [1] * 5
+    assert time.perf_counter() - t0 < 0.2  # nobody waited for the refresh
+    deadline = time.monotonic() + 5
+    while cache.peek("k")[0] != 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert cache.peek("k")[0] == 2
+    assert stub.requests == 2
+    assert cache.stats()["stale_hits"] == 5
+
+
+def test_entry_past_the_stale_window_is_fetched_inline(stub, fetch):
+    clock = Clock()
+    cache = TTLCache(ttl=10, stale_ttl=60, clock=clock)
+    cache.get("k", fetch)
+    clock.now = 100
+    assert cache.get("k", fetch)[0] == 2
+
+
+def test_last_known_good_when_the_refetch_fails(stub, fetch):
+    clock = Clock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.get("k", fetch)
+    stub.error_rate = 1.0
+    clock.now = 100
+    assert cache.get("k", fetch)[0] == 1
+    assert cache.stats()["fallbacks"] == 1
+    with pytest.raises(requests.RequestException):
+        TTLCache(ttl=10).get("other", fetch)
+
+
+@pytest.fixture
+def guarded(stub):
+    """``call()`` sends one forecast request through a HostGuard with a 3-failure, 30 s breaker."""
+    clock = Clock()
+    guard = HostGuard("stub", concurrency=4, queue_wait=1,
+                      breaker=CircuitBreaker("stub", failures=3, reset=30, board=MemoryBoard(), clock=clock))
+    url = stub.url + "/v1/forecast?latitude=37.27&longitude=-76.71"
+
+    def call():
+        return guard.call(lambda: requests.get(url, timeout=5))
+
+    return guard, clock, call
+
+
+def test_breaker_opens_after_failures_in_a_row(stub, guarded):
+    guard, clock, call = guarded
+    breaker = guard.breaker
+    stub.error_rate = 1.0
+    call(), call()
+    stub.error_rate = 0.0
+    call()  # a success starts the count again
+    stub.error_rate = 1.0
+    call(), call()
+    assert breaker.state == "closed"
+    call()
+    assert breaker.state == "open"
+    assert breaker.retry_in() == 30
+
+
+def test_open_breaker_rejects_without_calling(stub, guarded):
+    guard, clock, call = guarded
+    breaker = guard.breaker
+    stub.error_rate = 1.0
+    for _ in range(3):
+        call()
+    sent = stub.requests
+    clock.now = 29
+    with pytest.raises(UpstreamUnavailable):
+        call()
+    assert stub.requests == sent
+    assert breaker.rejected == 1
+
+
+def test_half_open_breaker_lets_one_probe_through(stub, guarded):
+    guard, clock, call = guarded
+    breaker = guard.breaker
+    stub.error_rate = 1.0
+    for _ in range(3):
+        call()
+    clock.now = 30
+    assert breaker.state == "half-open"
+    stub.error_rate, stub.latency = 0.0, 0.5
+    sent = stub.requests
+    probe = threading.Thread(target=call)
+    probe.start()
+    while stub.requests == sent:
+        time.sleep(0.01)
+    with pytest.raises(UpstreamUnavailable):
+        call()  # the probe is still out
+    probe.join()
+    assert stub.requests == sent + 1
+
+
+def test_probe_success_closes_the_breaker(stub, guarded):
+    guard, clock, call = guarded
+    breaker = guard.breaker
+    stub.error_rate = 1.0
+    for _ in range(3):
+        call()
+    clock.now = 30
+    stub.error_rate = 0.0
+    assert call().status_code == 200
+    assert breaker.state == "closed"
+    assert breaker.board.read("stub")["errors"] == 0
+    call()
+
+
+def test_probe_failure_reopens_the_breaker(stub, guarded):
+    guard, clock, call = guarded
+    breaker = guard.breaker
+    stub.error_rate = 1.0
+    for _ in range(3):
+        call()
+    clock.now = 30
+    assert call().status_code == 503
+    assert breaker.state == "open"
+    assert breaker.retry_in() == 30
+    assert breaker.opened == 1  # still the same outage
+
+
+def test_abandoned_probe_frees_the_next_one(stub, guarded):
+    guard, clock, call = guarded
+    stub.error_rate = 1.0
+    for _ in range(3):
+        call()
+    clock.now = 30
+
+    def send():
+        raise ValueError("the probe was never sent")  # an error of ours, not the host's
+
+    with pytest.raises(ValueError):
+        guard.call(send)
+    stub.error_rate = 0.0
+    assert call().status_code == 200
+    assert guard.breaker.state == "closed"
+
+
+def test_retry_after_sets_the_open_window(stub, guarded):
+    guard, clock, call = guarded
+    breaker = guard.breaker
+    stub.error_rate, stub.error_status, stub.retry_after = 1.0, 429, 120
+    assert call().status_code == 429
+    assert breaker.state == "open"  # at once, not after 3 failures
+    assert breaker.retry_in() == 120
+    clock.now = 119
+    with pytest.raises(UpstreamUnavailable):
+        call()
+    clock.now = 120
+    stub.error_rate = 0.0
+    assert call().status_code == 200
+
+
+def test_boards_sharing_a_file_share_breaker_state(stub, tmp_path):
+    clock = Clock()
+    first, second = (
+        CircuitBreaker("stub", failures=2, reset=30, board=SQLiteBoard(tmp_path / "breakers.sqlite"), clock=clock)
+        for _ in range(2)
+    )
+    first.failure()
+    second.failure()  # one count across both
+    assert first.state == second.state == "open"
+    assert not second.allow()
+    clock.now = 30
+    assert first.allow()  # the probe
+    assert not second.allow()
+    first.success()
+    assert second.state == "closed"
+    assert second.allow()